@@ -0,0 +1,304 @@
+"""
+Benchmarks of the model layer (`src.core.model.DataBase`).
+
+Each dataset size gets its own database, generated locally, then every
+case runs a few times and its fastest, median and p95 latencies are
+reported.
+Compared against a baseline file, a case slower than the baseline by
+more than the threshold fails the run.
+
+    python -m benchmarks.model --sizes 1k 100k
+    python -m benchmarks.model --sizes 1k 100k 1m --update-baseline
+    python -m benchmarks.model --data-dir /tmp/bench   (reuse datasets)
+
+The baseline holds the numbers of the machine that wrote it, write one
+of your own (`--update-baseline`) before comparing with a change.
+
+Passwords are hashed with a cheap scrypt cost, the numbers are about
+the database work, not about `PasswordHasher`.
+"""
+# python
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+# local
+from src.core.model import DataBase
+from src.core.security import PasswordHasher
+
+BASELINE_FILE = Path(__file__).with_name('baseline.json')
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+# todos per user of the generated datasets.
+TODOS_PER_USER = 1_000
+BULK_ROWS = 1_000
+THRESHOLD = 0.25
+# sub-millisecond cases jitter by more than the threshold, slowdowns
+# smaller than this are not regressions.
+MIN_SLOWDOWN_MS = 1.0
+
+
+def cheap_hasher() -> PasswordHasher:
+    return PasswordHasher(n=2**4, max_workers=1)
+
+
+def open_database(path: Path) -> DataBase:
+    return DataBase(
+        path, hasher=cheap_hasher(), write_behind=False, default_user=False
+    )
+
+
+def generate(path: Path, todos: int) -> None:
+    """`todos` todos spread over users of `TODOS_PER_USER` todos each."""
+    database = open_database(path)
+    try:
+        users = max(todos // TODOS_PER_USER, 1)
+        password = database.hasher.hash('secret')
+        database.import_rows(
+            'user',
+            (
+                {'id': id, 'username': f'user-{id}', 'password': password}
+                for id in range(1, users + 1)
+            ),
+        )
+        database.import_rows(
+            'todo',
+            (
+                {
+                    'id': id,
+                    'description': f'todo number {id} of the benchmark',
+                    'completed': id % 3 == 0,
+                    'id_user': (id - 1) % users + 1,
+                }
+                for id in range(1, todos + 1)
+            ),
+            chunk_size=5_000,
+        )
+    finally:
+        database.close()
+
+
+def dataset(directory: Path, size: str) -> Path:
+    """The database of `size`, generated unless it is there already."""
+    path = directory / f'bench-{size}.sqlite3'
+    done = path.with_name(f'{path.name}.done')
+    if not done.exists():
+        for stale in directory.glob(f'{path.name}*'):
+            stale.unlink()
+        generate(path, SIZES[size])
+        done.touch()
+    return path
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[], object]
+    # runs before every measured call, not measured.
+    setup: Optional[Callable[[], object]] = None
+    repeat: int = 20
+
+
+def cases(database: DataBase) -> List[Case]:
+    """What we measure, on a database generated by `generate`."""
+    counter = iter(range(10**9))
+    user = database.filter_users(username='user-1')[0]
+    ids = [todo.id for todo in database.page_todos(user.id, limit=BULK_ROWS)]
+    # writes go to users of their own, the reads keep their dataset.
+    writer = database.register_user('writer', 'secret')
+    toggler = database.register_user('toggler', 'secret')
+    toggled: List[int] = []
+
+    def bulk_rows(id_user: int) -> Iterator[dict]:
+        return (
+            {'description': 'bulk', 'completed': False, 'id_user': id_user}
+            for _ in range(BULK_ROWS)
+        )
+
+    def reset_toggled() -> None:
+        if not toggled:
+            database.bulk_register_todos(bulk_rows(toggler.id))
+            toggled.extend(
+                todo.id for todo in database.filter_todos(id_user=toggler.id)
+            )
+        database.mark_todos_completed(toggled, False)
+
+    return [
+        Case(
+            'register_user',
+            lambda: database.register_user(f'new-{next(counter)}', 'secret'),
+        ),
+        Case('login_user', lambda: database.login_user('user-1', 'secret')),
+        Case(
+            'register_todo',
+            lambda: database.register_todo('new todo', False, writer.id),
+        ),
+        Case(
+            'filter_todos',
+            lambda: database.filter_todos(id_user=user.id, completed=False),
+            setup=database.todo_cache.clear,
+        ),
+        Case(
+            'filter_todos_cached',
+            lambda: database.filter_todos(id_user=user.id, completed=False),
+        ),
+        Case(
+            'page_todos',
+            lambda: database.page_todos(user.id, after_id=ids[len(ids) // 2]),
+            setup=database.todo_cache.clear,
+        ),
+        Case('search_todos', lambda: database.search_todos(user.id, 'numb')),
+        Case(
+            'bulk_register_todos',
+            lambda: database.bulk_register_todos(bulk_rows(writer.id)),
+            repeat=10,
+        ),
+        Case(
+            'mark_todos_completed',
+            lambda: database.mark_todos_completed(toggled),
+            setup=reset_toggled,
+        ),
+        Case(
+            'complete_all_todos',
+            lambda: database.complete_all_todos(toggler.id),
+            setup=reset_toggled,
+        ),
+    ]
+
+
+def measure(case: Case) -> Dict[str, float]:
+    # one untimed run first, for the caches and the statement cache.
+    if case.setup is not None:
+        case.setup()
+    case.run()
+
+    timings = []
+    for _ in range(case.repeat):
+        if case.setup is not None:
+            case.setup()
+        started = time.perf_counter()
+        case.run()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return {
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[int(0.95 * (len(timings) - 1))], 3),
+    }
+
+
+def run(size: str, directory: Path) -> Dict[str, Dict[str, float]]:
+    # the cases write, measure a copy and keep the dataset pristine.
+    path = directory / f'run-{size}.sqlite3'
+    shutil.copyfile(dataset(directory, size), path)
+    database = open_database(path)
+    try:
+        results = {}
+        for case in cases(database):
+            results[case.name] = measure(case)
+            print(
+                f'{size:>5} {case.name:<22} '
+                f'{results[case.name]["min_ms"]:>10.3f}ms min '
+                f'{results[case.name]["median_ms"]:>10.3f}ms median '
+                f'{results[case.name]["p95_ms"]:>10.3f}ms p95'
+            )
+        return results
+    finally:
+        database.close()
+        for file in directory.glob(f'{path.name}*'):
+            file.unlink()
+
+
+def regressions(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    baseline: Dict[str, Dict[str, Dict[str, float]]],
+    threshold: float = THRESHOLD,
+    min_slowdown_ms: float = MIN_SLOWDOWN_MS,
+) -> List[str]:
+    """
+    The cases slower than the baseline by more than `threshold`. we compare
+    the fastest runs, the medians move too much with the machine's load.
+    """
+    failures = []
+    for size, cases in results.items():
+        for name, result in cases.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+            limit = max(
+                expected['min_ms'] * (1 + threshold),
+                expected['min_ms'] + min_slowdown_ms,
+            )
+            if result['min_ms'] > limit:
+                failures.append(
+                    f'{size} {name}: {result["min_ms"]}ms, baseline '
+                    f'{expected["min_ms"]}ms (limit {limit:.3f}ms)'
+                )
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.model')
+    parser.add_argument(
+        '--sizes', nargs='+', choices=SIZES, default=['1k', '100k']
+    )
+    parser.add_argument(
+        '--data-dir',
+        type=Path,
+        help='keep the generated datasets here, to reuse them',
+    )
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE)
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=THRESHOLD,
+        help='allowed slowdown over the baseline (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--min-slowdown',
+        type=float,
+        default=MIN_SLOWDOWN_MS,
+        help='ignore slowdowns under this many ms (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--update-baseline',
+        action='store_true',
+        help='write these results as the new baseline',
+    )
+    args = parser.parse_args(argv)
+    # the slow search queries are expected here, keep the report readable.
+    logging.getLogger('src.core.instrumentation').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.data_dir or Path(temporary)
+        directory.mkdir(parents=True, exist_ok=True)
+        results = {size: run(size, directory) for size in args.sizes}
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    if args.update_baseline:
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + '\n')
+        print(f'Baseline written to {args.baseline}.')
+        return 0
+
+    failures = regressions(
+        results, baseline, args.threshold, args.min_slowdown
+    )
+    for failure in failures:
+        print(f'REGRESSION {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
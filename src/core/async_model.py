@@ -0,0 +1,590 @@
+"""
+This is the asyncio flavour of our model layer.
+
+It has the same api as `DataBase`, but every method is a coroutine, so
+flet web deployments can serve many sessions from one event loop.
+"""
+# python
+import asyncio
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# 3rd
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# local
+from src.core import migrations
+from src.core.cache import LRUCache
+from src.core.instrumentation import get_query_stats
+from src.core.model import (
+    BULK_CHUNK_SIZE,
+    AlreadyRegistered,
+    AuthSession,
+    Base,
+    DataBase,
+    NotRegistered,
+    RequiredField,
+    Todo,
+    User,
+    change_todo_counters,
+    database_url,
+    get_engine_profile,
+    listen_sqlite_pragmas,
+)
+from src.core.security import PasswordHasher, get_password_hasher
+from src.core.tokens import SessionTokens
+from src.core.write_behind import WriteBehindQueue
+from src.utils import constants
+
+# the asyncio driver of each backend we support.
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'psycopg'}
+
+
+def async_database_url(db_name: Union[str, URL]) -> URL:
+    """`database_url`, with the asyncio driver of its backend."""
+    url = database_url(db_name)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver for {backend}.')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def create_async_database_engine(
+    db_name: Union[str, URL], profile: Optional[Dict[str, Any]] = None
+) -> AsyncEngine:
+    """Same as `create_database_engine`, but on an asyncio driver."""
+    profile = get_engine_profile(profile)
+    url = async_database_url(db_name)
+    options: Dict[str, Any] = {}
+    pragmas = profile.get('pragmas', {})
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {
+            'timeout': pragmas.get('busy_timeout', 5000) / 1000
+        }
+
+    engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=profile.get('pool_size', 5),
+        max_overflow=profile.get('max_overflow', 10),
+        pool_timeout=profile.get('pool_timeout', 30),
+        pool_recycle=profile.get('pool_recycle', -1),
+        pool_pre_ping=profile.get('pool_pre_ping', False),
+        **options,
+    )
+    if url.get_backend_name() == 'sqlite':
+        listen_sqlite_pragmas(engine.sync_engine, pragmas)
+
+    return engine
+
+
+class AsyncDataBase:
+    def __init__(
+        self,
+        db_name: Union[str, URL],
+        profile: Optional[Dict[str, Any]] = None,
+        hasher: Optional[PasswordHasher] = None,
+        default_user: bool = True,
+        tokens: Optional[SessionTokens] = None,
+        todo_cache: Optional[LRUCache] = None,
+        write_behind: Optional[WriteBehindQueue] = None,
+    ) -> None:
+        """
+        This class will configure our database, the tables and the default
+        user are created by the first unit of work (see `start`). `tokens`,
+        `todo_cache` and `write_behind` are the ones of the sync twin, kept
+        in sync: our todo writes drop its cached reads, and wait for its
+        queued writes first.
+        """
+        self.hasher = hasher or get_password_hasher()
+        self.default_user = default_user
+        self.tokens = tokens
+        self.todo_cache = todo_cache or LRUCache(constants.TODO_CACHE_SIZE)
+        self.write_behind = write_behind
+        self.engine = create_async_database_engine(db_name, profile)
+        if constants.QUERY_STATS:
+            get_query_stats().attach(self.engine.sync_engine)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.started = False
+        self._start_lock = asyncio.Lock()
+
+        # the session of the running unit of work, per asyncio task.
+        self._session: ContextVar[Optional[AsyncSession]] = ContextVar(
+            f'async_database_session_{id(self)}', default=None
+        )
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self.started:
+                return
+
+            async with self.engine.begin() as connection:
+                await connection.run_sync(migrations.upgrade, Base.metadata)
+
+            if self.default_user:
+                async with self.Session() as session, session.begin():
+                    token = self._session.set(session)
+                    try:
+                        await self.create_default_user()
+                    finally:
+                        self._session.reset(token)
+
+            self.started = True
+
+    @asynccontextmanager
+    async def session_scope(self) -> AsyncIterator[AsyncSession]:
+        """
+        One unit of work: commit on success, rollback on error, then close.
+        nested scopes in the same task join the outermost one.
+        """
+        session = self._session.get()
+        if session is not None:
+            yield session
+            return
+
+        if not self.started:
+            await self.start()
+
+        session = self.Session()
+        token = self._session.set(session)
+        try:
+            yield session
+            await session.commit()
+            callbacks = session.info.pop('on_commit', [])
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            self._session.reset(token)
+            await session.close()
+
+        for callback in callbacks:
+            callback()
+
+    def on_commit(
+        self, session: AsyncSession, callback: Callable[[], Any]
+    ) -> None:
+        """Run `callback` once the unit of work of `session` is committed."""
+        session.info.setdefault('on_commit', []).append(callback)
+
+    def invalidate_todos(self, session: AsyncSession, *id_users: int) -> None:
+        """the todos of these users changed, drop their cached reads."""
+        for id_user in set(id_users):
+            self.on_commit(
+                session, partial(self.todo_cache.invalidate, id_user)
+            )
+
+    async def flush(self) -> None:
+        """
+        Write the queued todo writes of the sync twin now (on a thread, it
+        blocks), so ours never land before them.
+        """
+        if self.write_behind is not None and len(self.write_behind):
+            await asyncio.to_thread(self.write_behind.flush)
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+
+    def dispose(self) -> None:
+        """
+        `close` for sync code (`DataBase.close`, a tenant evicted by the
+        router), on an event loop of its own. aiosqlite keeps a (non daemon)
+        thread per connection until it is closed.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.engine.dispose())
+            return
+
+        # called from a coroutine (flet's loop), asyncio.run can't nest.
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.engine.dispose(),),
+            name='async-database-dispose',
+        )
+        thread.start()
+        thread.join()
+
+    async def count_todos(
+        self, session: AsyncSession, id_user: int, total: int, completed: int
+    ) -> None:
+        if id_user is not None and (total or completed):
+            await session.execute(
+                change_todo_counters(id_user, total, completed)
+            )
+
+    async def todo_counters(self, id_user: int) -> Tuple[int, int]:
+        await self.flush()
+        query = select(User.todo_count, User.completed_count).where(
+            User.id == id_user
+        )
+        async with self.session_scope() as session:
+            row = (await session.execute(query)).first()
+            return (0, 0) if row is None else (row[0], row[1])
+
+    async def create_default_user(self) -> None:
+        username = constants.DEFAULT_USERNAME
+        password = constants.DEFAULT_PASSWORD
+        async with self.session_scope():
+            if not await self.filter_users(username=username):
+                user = User(
+                    username=username,
+                    password=await self.hasher.hash_async(password),
+                )
+                await self.insert_user(user)
+
+    async def insert_user(self, user: 'User') -> None:
+        if user.username is None:
+            raise RequiredField('username')
+
+        elif user.password is None:
+            raise RequiredField('password')
+
+        async with self.session_scope() as session:
+            if await self.filter_users(username=user.username):
+                raise AlreadyRegistered('username')
+
+            session.add(user)
+
+    async def insert_todo(self, todo: 'Todo') -> None:
+        if todo.description is None:
+            raise RequiredField('description')
+
+        await self.flush()
+        async with self.session_scope() as session:
+            session.add(todo)
+            await self.count_todos(
+                session, todo.id_user, 1, int(bool(todo.completed))
+            )
+            self.invalidate_todos(session, todo.id_user)
+
+    async def update_todo(self, todo: 'Todo') -> None:
+        if todo.description is None:
+            raise RequiredField('description')
+
+        if todo.completed is None:
+            raise RequiredField('completed')
+
+        await self.flush()
+        async with self.session_scope() as session:
+            stored = (
+                None if todo.id is None else await session.get(Todo, todo.id)
+            )
+            if stored is not None:
+                id_user, completed = stored.id_user, int(stored.completed)
+                await self.count_todos(session, id_user, -1, -completed)
+                self.invalidate_todos(session, id_user)
+            await session.merge(todo)
+            await self.count_todos(
+                session, todo.id_user, 1, int(todo.completed)
+            )
+            self.invalidate_todos(session, todo.id_user)
+
+    async def update_user_password(self, user: 'User') -> None:
+        async with self.session_scope() as session:
+            await session.execute(
+                update(User)
+                .where(User.id == user.id)
+                .values(password=user.password)
+            )
+
+    async def delete_user(self, user: 'User') -> None:
+        await self.flush()
+        async with self.session_scope() as session:
+            # its sessions go first, they point to it.
+            await session.execute(
+                delete(AuthSession).where(AuthSession.id_user == user.id)
+            )
+            await session.delete(await session.merge(user))
+            self.invalidate_todos(session, user.id)
+            if self.tokens is not None:
+                self.on_commit(
+                    session, partial(self.tokens.forget_user, user.id)
+                )
+
+    async def delete_todo(self, todo: 'Todo') -> None:
+        await self.flush()
+        async with self.session_scope() as session:
+            stored = await session.get(Todo, todo.id)
+            if stored is None:
+                return
+
+            await session.delete(stored)
+            id_user, completed = stored.id_user, int(stored.completed)
+            await self.count_todos(session, id_user, -1, -completed)
+            self.invalidate_todos(session, id_user)
+
+    async def select_users(self, with_todos: bool = False) -> List['User']:
+        query = select(User)
+        if with_todos:
+            await self.flush()
+            query = query.options(selectinload(User.todos))
+        async with self.session_scope() as session:
+            return list(await session.scalars(query))
+
+    async def select_todos(self, with_user: bool = False) -> List['Todo']:
+        await self.flush()
+        query = select(Todo)
+        if with_user:
+            query = query.options(joinedload(Todo.user))
+        async with self.session_scope() as session:
+            return list(await session.scalars(query))
+
+    async def select_user_by_id(
+        self, id: int, with_todos: bool = False
+    ) -> Optional['User']:
+        options = [selectinload(User.todos)] if with_todos else []
+        if with_todos:
+            await self.flush()
+        async with self.session_scope() as session:
+            return await session.get(User, id, options=options)
+
+    async def select_todo_by_id(self, id: int) -> Optional['Todo']:
+        await self.flush()
+        async with self.session_scope() as session:
+            return await session.get(Todo, id)
+
+    async def filter_users(
+        self, with_todos: bool = False, **values
+    ) -> List['User']:
+        query = select(User).filter_by(**values)
+        if with_todos:
+            await self.flush()
+            query = query.options(selectinload(User.todos))
+        async with self.session_scope() as session:
+            return list(await session.scalars(query))
+
+    async def filter_todos(
+        self, with_user: bool = False, **values
+    ) -> List['Todo']:
+        await self.flush()
+        query = select(Todo).filter_by(**values)
+        if with_user:
+            query = query.options(joinedload(Todo.user))
+        async with self.session_scope() as session:
+            return list(await session.scalars(query))
+
+    async def page_todos(
+        self, id_user: int, after_id: Optional[int] = None, limit: int = 50
+    ) -> List['Todo']:
+        await self.flush()
+        query = select(Todo).where(Todo.id_user == id_user)
+        if after_id is not None:
+            query = query.where(Todo.id > after_id)
+        query = query.order_by(Todo.id).limit(limit)
+
+        async with self.session_scope() as session:
+            return list(await session.scalars(query))
+
+    async def iter_todos(
+        self, id_user: Optional[int] = None, batch_size: int = 500
+    ) -> AsyncIterator['Todo']:
+        await self.flush()
+        query = select(Todo).order_by(Todo.id)
+        if id_user is not None:
+            query = query.where(Todo.id_user == id_user)
+        query = query.execution_options(yield_per=batch_size)
+
+        async with self.session_scope() as session:
+            result = await session.stream_scalars(query)
+            async for partition in result.partitions():
+                for todo in partition:
+                    session.expunge(todo)
+                    yield todo
+
+    async def register_user(
+        self, username: Optional[str], password: Optional[str]
+    ) -> 'User':
+        if username is None:
+            raise RequiredField('username')
+
+        if password is None:
+            raise RequiredField('password')
+
+        user = User(
+            username=username, password=await self.hasher.hash_async(password)
+        )
+        await self.insert_user(user)
+
+        return user
+
+    async def login_user(
+        self, username: Optional[str], password: Optional[str]
+    ) -> 'User':
+        if username is None:
+            raise RequiredField('username')
+
+        if password is None:
+            raise RequiredField('password')
+
+        # lookup by the (unique, so indexed) username only. an unknown
+        # one costs a verify too, the timing mustn't tell it apart.
+        users = await self.filter_users(username=username)
+        if not users:
+            await self.hasher.verify_unknown_async(password)
+            raise NotRegistered('Invalid username or password')
+        if not await self.hasher.verify_async(password, users[0].password):
+            raise NotRegistered('Invalid username or password')
+
+        # upgrade plaintext (or outdated) hashes, now that we know it.
+        user = users[0]
+        if self.hasher.needs_rehash(user.password):
+            user.password = await self.hasher.hash_async(password)
+            await self.update_user_password(user)
+
+        return user
+
+    async def register_todo(
+        self,
+        description: Optional[str],
+        completed: Optional[bool],
+        id_user: Optional[int],
+    ) -> 'Todo':
+        if description is None:
+            raise RequiredField('description')
+
+        if completed is None:
+            raise RequiredField('completed')
+
+        if id_user is None:
+            raise RequiredField('id_user')
+
+        todo = Todo(
+            description=description, completed=completed, id_user=id_user
+        )
+        await self.insert_todo(todo)
+
+        return todo
+
+    async def bulk_register_todos(
+        self, todos: Iterable[Dict[str, Any]]
+    ) -> int:
+        rows = []
+        for values in todos:
+            for field in ('description', 'completed', 'id_user'):
+                if values.get(field) is None:
+                    raise RequiredField(field)
+
+            rows.append(
+                {
+                    'description': values['description'],
+                    'completed': values['completed'],
+                    'id_user': values['id_user'],
+                }
+            )
+
+        if not rows:
+            return 0
+
+        totals = Counter(row['id_user'] for row in rows)
+        completed = Counter(row['id_user'] for row in rows if row['completed'])
+        await self.flush()
+        async with self.session_scope() as session:
+            await session.execute(insert(Todo), rows)
+            for id_user, total in totals.items():
+                await self.count_todos(
+                    session, id_user, total, completed[id_user]
+                )
+            self.invalidate_todos(session, *totals)
+
+        return len(rows)
+
+    async def mark_todos_completed(
+        self, ids: Iterable[int], completed: bool = True
+    ) -> int:
+        ids = list(ids)
+        count = 0
+        await self.flush()
+        async with self.session_scope() as session:
+            for start in range(0, len(ids), BULK_CHUNK_SIZE):
+                chunk = ids[start : start + BULK_CHUNK_SIZE]
+                changed = Counter(
+                    await session.scalars(
+                        update(Todo)
+                        .where(Todo.id.in_(chunk), Todo.completed != completed)
+                        .values(completed=completed)
+                        .returning(Todo.id_user)
+                        .execution_options(synchronize_session=False)
+                    )
+                )
+                for id_user, total in changed.items():
+                    delta = total if completed else -total
+                    await self.count_todos(session, id_user, 0, delta)
+                self.invalidate_todos(session, *changed)
+                count += sum(changed.values())
+
+        return count
+
+    async def complete_all_todos(self, id_user: int) -> int:
+        await self.flush()
+        async with self.session_scope() as session:
+            result = await session.execute(
+                update(Todo)
+                .where(Todo.id_user == id_user, Todo.completed.is_(False))
+                .values(completed=True)
+                .execution_options(synchronize_session=False)
+            )
+            await self.count_todos(session, id_user, 0, result.rowcount)
+            self.invalidate_todos(session, id_user)
+            return result.rowcount
+
+    async def delete_completed_todos(self, id_user: int) -> int:
+        await self.flush()
+        async with self.session_scope() as session:
+            result = await session.execute(
+                delete(Todo)
+                .where(Todo.id_user == id_user, Todo.completed.is_(True))
+                .execution_options(synchronize_session=False)
+            )
+            count = result.rowcount
+            await self.count_todos(session, id_user, -count, -count)
+            self.invalidate_todos(session, id_user)
+            return count
+
+
+_twins_lock = threading.Lock()
+
+
+def get_async_database(database: DataBase) -> AsyncDataBase:
+    """
+    The `get_database` of the async world: the `AsyncDataBase` of the very
+    database of `database` (a tenant one, say) with its engine profile,
+    kept on it as its `async_twin` and disposed by its `close`. that one
+    created the schema and its default user already.
+    """
+    with _twins_lock:
+        if database.async_twin is None:
+            database.async_twin = AsyncDataBase(
+                database.engine.url,
+                profile=database.profile,
+                hasher=database.hasher,
+                default_user=False,
+                tokens=database.tokens,
+                todo_cache=database.todo_cache,
+                write_behind=database.write_behind,
+            )
+        return database.async_twin
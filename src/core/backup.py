@@ -0,0 +1,162 @@
+"""
+Online backups of a sqlite database, and snapshots taken on a schedule.
+
+The copy goes through sqlite's backup api, a few pages per step with a
+short sleep in between, so sessions keep writing while it runs. it is
+written to a temporary file and renamed, a backup is never seen torn.
+"""
+# python
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+# 3rd
+from sqlalchemy.engine import Engine
+
+# local
+from src.utils import constants
+
+if TYPE_CHECKING:
+    from src.core.model import DataBase
+
+logger = logging.getLogger(__name__)
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+def online_backup(
+    engine: Engine,
+    dest: Path,
+    pages: int = constants.BACKUP_PAGES,
+    sleep: float = constants.BACKUP_SLEEP,
+    max_restarts: int = constants.BACKUP_MAX_RESTARTS,
+) -> Path:
+    """
+    Copy the sqlite database of `engine` into `dest`, `pages` at a time.
+
+    a write from another connection between two steps makes sqlite start
+    the copy over. after `max_restarts` of them we copy in a single step:
+    in wal mode that is one read snapshot, writers are still not blocked.
+    """
+    if engine.dialect.name != 'sqlite':
+        raise ValueError('Online backups need a sqlite database.')
+
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    temporary = dest.with_name(f'{dest.name}.tmp')
+    restarts = 0
+    remaining_before: Optional[int] = None
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal restarts, remaining_before
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupRestarted()
+        remaining_before = remaining
+
+    source = engine.raw_connection()
+    try:
+        target = sqlite3.connect(temporary)
+        try:
+            try:
+                source.driver_connection.backup(
+                    target, pages=pages, sleep=sleep, progress=progress
+                )
+            except BackupRestarted:
+                logger.warning(
+                    'Backup restarted %s times, copying in one step', restarts
+                )
+                source.driver_connection.backup(target, pages=-1)
+        finally:
+            target.close()
+        os.replace(temporary, dest)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    finally:
+        source.close()
+
+    return dest
+
+
+class SnapshotScheduler:
+    def __init__(
+        self,
+        database: 'DataBase',
+        directory: Path = constants.SNAPSHOT_DIR,
+        interval: float = constants.SNAPSHOT_INTERVAL,
+        keep: int = constants.SNAPSHOT_KEEP,
+    ) -> None:
+        """
+        This class will back `database` up every `interval` seconds into
+        `directory`, keeping only the `keep` most recent snapshots.
+        """
+        self.database = database
+        self.directory = Path(directory)
+        self.interval = interval
+        self.keep = keep
+        self.snapshots = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='snapshots', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def prefix(self) -> str:
+        return Path(self.database.engine.url.database).stem
+
+    def existing(self) -> List[Path]:
+        """The snapshots of our database, oldest first."""
+        return sorted(self.directory.glob(f'{self.prefix}-*.sqlite3'))
+
+    def snapshot(self) -> Path:
+        # the timestamp sorts the file names in time order.
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')
+        path = self.database.backup(
+            self.directory / f'{self.prefix}-{stamp}.sqlite3'
+        )
+        self.snapshots += 1
+        self.prune()
+        return path
+
+    def prune(self) -> List[Path]:
+        """Delete the snapshots past `keep`, returns them."""
+        snapshots = self.existing()
+        expired = snapshots[: max(len(snapshots) - self.keep, 0)]
+        for path in expired:
+            path.unlink(missing_ok=True)
+        return expired
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception:
+                self.failures += 1
+                logger.exception('Snapshot failed')
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+
+        self._stop.set()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def stats(self) -> dict:
+        return {
+            'snapshots': self.snapshots,
+            'failures': self.failures,
+            'kept': len(self.existing()),
+        }
@@ -0,0 +1,154 @@
+"""
+One `page.update()` per event, however many the handlers ask for.
+
+Every `page.update()` diffs the whole control tree and pushes it to the
+client. inside `batched_updates(page)` (or a `batched` method) they are
+only recorded, the batch sends a single update when it ends: of the whole
+page if any call asked for it, else of the controls that were updated.
+"""
+# python
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Iterator, List, Optional
+
+
+@dataclass
+class Batch:
+    page: Any
+    whole_page: bool = False
+    controls: List[Any] = field(default_factory=list)
+    # a thread or task outliving its batch updates right away.
+    closed: bool = False
+
+    def add(self, controls: tuple) -> None:
+        if not controls:
+            self.whole_page = True
+        for control in controls:
+            if not any(control is seen for seen in self.controls):
+                self.controls.append(control)
+
+    @property
+    def dirty(self) -> bool:
+        return self.whole_page or bool(self.controls)
+
+
+_current_batch: ContextVar[Optional[Batch]] = ContextVar(
+    'current_batch', default=None
+)
+
+
+class UpdateBatcher:
+    def __init__(self, page: Any) -> None:
+        """
+        This class will take over `page.update`, holding the calls made
+        inside a batch. `requested` counts the calls, `pushed` the updates
+        really sent and `batches` the batches that ended.
+        """
+        self.page = page
+        self._update = page.update
+        self.requested = 0
+        self.pushed = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        page.update = self.update
+
+    def update(self, *controls: Any) -> None:
+        with self._lock:
+            self.requested += 1
+        batch = _current_batch.get()
+        if batch is not None and batch.page is self.page and not batch.closed:
+            batch.add(controls)
+            return
+        self._push(controls)
+
+    def _push(self, controls: tuple) -> None:
+        with self._lock:
+            self.pushed += 1
+        self._update(*controls)
+
+    def flush(self) -> None:
+        """Send what the current batch holds now, a spinner before a wait."""
+        batch = _current_batch.get()
+        if batch is None or batch.page is not self.page or not batch.dirty:
+            return
+        controls = () if batch.whole_page else tuple(batch.controls)
+        batch.whole_page = False
+        batch.controls = []
+        self._push(controls)
+
+    @contextmanager
+    def batch(self) -> Iterator[Batch]:
+        current = _current_batch.get()
+        if current is not None and current.page is self.page:
+            # nested, the outermost batch sends.
+            yield current
+            return
+
+        batch = Batch(self.page)
+        token = _current_batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _current_batch.reset(token)
+            batch.closed = True
+            with self._lock:
+                self.batches += 1
+            if batch.dirty:
+                controls = () if batch.whole_page else tuple(batch.controls)
+                self._push(controls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requested': self.requested,
+                'pushed': self.pushed,
+                'batches': self.batches,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requested = self.pushed = self.batches = 0
+
+
+_batchers_lock = threading.Lock()
+
+
+def get_update_batcher(page: Any) -> UpdateBatcher:
+    """The batcher of `page`, installed on first use."""
+    with _batchers_lock:
+        batcher = getattr(page, 'update_batcher', None)
+        if batcher is None:
+            batcher = UpdateBatcher(page)
+            page.update_batcher = batcher
+        return batcher
+
+
+def batched_updates(page: Any):
+    return get_update_batcher(page).batch()
+
+
+def flush_updates(page: Any) -> None:
+    get_update_batcher(page).flush()
+
+
+def batched(function: Callable) -> Callable:
+    """A method (of an object with a `page`) sending one update at most."""
+    if asyncio.iscoroutinefunction(function):
+
+        @wraps(function)
+        async def run_async(self: Any, *args: Any, **kwargs: Any) -> Any:
+            with batched_updates(self.page):
+                return await function(self, *args, **kwargs)
+
+        return run_async
+
+    @wraps(function)
+    def run(self: Any, *args: Any, **kwargs: Any) -> Any:
+        with batched_updates(self.page):
+            return function(self, *args, **kwargs)
+
+    return run
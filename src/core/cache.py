@@ -0,0 +1,126 @@
+"""
+A small thread safe LRU cache, with optional time to live per entry.
+"""
+# python
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+# value, expiration (monotonic clock) and group.
+Entry = Tuple[Any, Optional[float], Hashable]
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        """
+        Keep at most `maxsize` entries, the least recently used ones are
+        evicted first. entries older than `ttl` seconds are dropped on read.
+
+        entries may belong to a group (the todos of an user, for example),
+        so all of them are invalidated at once.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data: 'OrderedDict[Hashable, Entry]' = OrderedDict()
+        self._groups: Dict[Hashable, Set[Hashable]] = {}
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _discard(self, key: Hashable) -> Any:
+        value, _, group = self._data.pop(key)
+        if group is not None:
+            keys = self._groups[group]
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, expires_at, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, group: Hashable) -> Tuple[int, int]:
+        """
+        Read it before loading a value of `group`, and hand it to `set`:
+        if the group was invalidated in between, the value is not cached.
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(group, 0)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        group: Hashable = None,
+        generation: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if generation is not None and generation != (
+                self._epoch,
+                self._generations.get(group, 0),
+            ):
+                return
+
+            if key in self._data:
+                self._discard(key)
+            self._data[key] = (value, expires_at, group)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+
+            while len(self._data) > self.maxsize:
+                self._discard(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._discard(key)
+
+    def invalidate(self, group: Hashable) -> None:
+        with self._lock:
+            self._generations[group] = self._generations.get(group, 0) + 1
+            for key in list(self._groups.get(group, ())):
+                self._discard(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+            self._groups.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
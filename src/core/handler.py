@@ -1,8 +1,16 @@
 """
 This is our controller layer.
 """
-from typing import TYPE_CHECKING, Any, Optional
+import asyncio
+import inspect
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Optional, Tuple
 
+from src.core import transfer
+from src.core.async_model import AsyncDataBase, get_async_database
+from src.core.batching import batched
+from src.core.instrumentation import action
 from src.core.model import (
     AlreadyRegistered,
     DataBase,
@@ -11,19 +19,28 @@ from src.core.model import (
     Todo,
     User,
 )
-from src.utils import constants
+from src.core.ratelimit import RateLimited, get_login_limiter
+from src.core.security import get_password_hasher
+from src.core.tenancy import get_tenant_router
+from src.core.tokens import SessionTokens
 
 if TYPE_CHECKING:
     from src.ui import Application
 
 
 class Handler:
+    # see `event_handler`.
+    asynchronous = False
+
     def __init__(self, application: 'Application') -> None:
         """This class will configure the application widgets events."""
         self.application = application
 
-        # yes, here is where our database will be started.
-        self.database = DataBase(constants.DB_NAME)
+        # yes, here is where our databases will be started (or reused, when
+        # another flet session already started them), one per tenant.
+        self.router = get_tenant_router()
+        self.tenant: Optional[str] = None
+        self.limiter = get_login_limiter()
         self.user: Optional[User] = None
 
         # ok, lets configure widgets events.
@@ -31,10 +48,55 @@ class Handler:
         self.__bind_register_view()
         self.__bind_user_interface_view()
 
-    def __bind_login_view(self) -> None:
-        self.application.login_button.on_click = lambda e: self.login_click()
+    @property
+    def database(self) -> DataBase:
+        """the database of the logged tenant, resolved on every request."""
+        return self.router.database(self.tenant, create=True)
+
+    @property
+    def page(self) -> Any:
+        return self.application.page
+
+    @property
+    def tokens(self) -> SessionTokens:
+        return self.tokens_for(self.tenant)
+
+    def tokens_for(self, tenant: Optional[str]) -> Optional[SessionTokens]:
+        database = self.router.database(tenant)
+        return None if database is None else database.tokens
+
+    def remember_session(self, tenant: str, user: User) -> None:
+        """the token only means something to its tenant database."""
+        self.tenant = tenant
+        token = self.tokens.issue(user)
+        self.application.set_session_token(f'{tenant}/{token}')
+
+    def stored_session(self) -> Tuple[Optional[str], Optional[str]]:
+        tenant, _, token = (
+            self.application.get_session_token() or ''
+        ).rpartition('/')
+        return tenant or None, token or None
 
-        self.application.register_button.on_click = (
+    def event_handler(self, handle: Callable[[Any], Any]) -> Callable:
+        """
+        The flet handler of an event, a coroutine function when `handle`
+        may return a coroutine (see `AsyncHandler`), awaited then.
+        """
+        if not self.asynchronous:
+            return handle
+
+        async def handle_async(e: Any) -> None:
+            result = handle(e)
+            if inspect.isawaitable(result):
+                await result
+
+        return handle_async
+
+    def __bind_login_view(self) -> None:
+        self.application.login_button.on_click = self.event_handler(
+            lambda e: self.login_click()
+        )
+        self.application.register_button.on_click = self.event_handler(
             lambda e: self.register_click()
         )
 
@@ -48,89 +110,242 @@ class Handler:
 
     def __bind_user_interface_view(self) -> None:
         self.application.logout_button.on_click = lambda e: self.logout_click()
+        self.application.exit_button.on_click = lambda e: self.exit_click()
 
-    def login_click(self) -> None:
-        """Will try login the user."""
-        try:
-            # 1) first, we get the fields values.
-            form = self.application.get_login_form()
-            username = form.get('username')
-            password = form.get('password')
+        # the path is None when the dialog was cancelled.
+        self.application.export_picker.on_result = self.event_handler(
+            lambda e: e.path and self.export_click(Path(e.path))
+        )
+        self.application.import_picker.on_result = self.event_handler(
+            lambda e: e.path and self.import_click(Path(e.path))
+        )
 
-            # 2) second, lets hide all messages.
-            self.application.hide_banner()
-            self.application.hide_login_form_error()
+    def read_login_form(self) -> Tuple[Optional[str], Optional[str]]:
+        # 1) first, we get the fields values.
+        form = self.application.get_login_form()
+        username = form.get('username')
+        password = form.get('password')
 
-            # 3) third, checking if this user exists.
-            user = self.database.login_user(username, password)
+        # 2) second, lets hide all messages.
+        self.application.hide_banner()
+        self.application.hide_login_form_error()
 
-            # 4) fourth, users exists so lets show the home view.
-            self.user = user
-            self.application.show_user_interface_view()
-            self.application.display_success_snack(f'Welcome {username}')
+        # 3) third, too many attempts never reach the database.
+        self.limiter.check(username, self.application.client_ip)
+        return username, password
 
+    def login_database(
+        self, username: Optional[str], password: Optional[str]
+    ) -> Tuple[str, DataBase]:
+        """
+        the tenant of `username` and its database, if there is one. when
+        there isn't, we take as long as a wrong password would.
+        """
+        tenant = self.router.tenant_for(username)
+        database = self.router.database(tenant)
+        if database is None:
+            if password is None:
+                raise RequiredField('password')
+            get_password_hasher().verify_unknown(password)
+            raise NotRegistered('Invalid username or password')
+        return tenant, database
+
+    def logged_in(self, tenant: str, user: User) -> None:
+        # 4) fourth, users exists so lets show the home view.
+        self.limiter.succeeded(user.username)
+        self.user = user
+        self.remember_session(tenant, user)
+        self.application.show_user_interface_view()
+        self.application.display_success_snack(f'Welcome {user.username}')
+
+    def login_failed(self, error: Exception) -> None:
         # ops, some required field is not informed, lets give a feedback.
-        except RequiredField as error:
+        if isinstance(error, RequiredField):
             self.application.display_login_form_error(error.field, str(error))
 
-        # ops, this user not exists, lets give a feedback.
-        except NotRegistered as error:
+        # ops, this user not exists (or too many attempts), lets give a
+        # feedback.
+        elif isinstance(error, (NotRegistered, RateLimited)):
             self.application.display_login_form_error('username', str(error))
 
         # ok, some thing really bad hapened.
+        else:
+            self.application.display_warning_banner(str(error))
+
+    @action('login')
+    @batched
+    def login_click(self) -> None:
+        """Will try login the user."""
+        try:
+            username, password = self.read_login_form()
+            tenant, database = self.login_database(username, password)
+            self.logged_in(tenant, database.login_user(username, password))
         except Exception as error:
+            self.login_failed(error)
+
+    def read_register_form(self) -> Tuple[Optional[str], Optional[str]]:
+        # 1) first, we get the input.
+        form = self.application.get_register_form()
+        username = form.get('username')
+        password = form.get('password')
+
+        # 2) second, lets hide all messages.
+        self.application.hide_banner()
+        self.application.hide_register_form_error()
+        return username, password
+
+    def registered(self, tenant: str, user: User) -> None:
+        # 4) fourth, lets show the home view.
+        self.user = user
+        self.remember_session(tenant, user)
+        self.application.show_user_interface_view()
+        self.application.display_success_snack(f'Welcome {user.username}')
+
+    def register_failed(self, error: Exception) -> None:
+        # ops, some required field is not informed (or this username is
+        # already in use), lets give a feedback.
+        if isinstance(error, (RequiredField, AlreadyRegistered)):
+            self.application.display_register_form_error(
+                error.field, str(error)
+            )
+
+        # ok, some thing really bad hapened.
+        else:
             self.application.display_warning_banner(str(error))
 
+    @action('register')
+    @batched
     def register_click(self) -> None:
         """Will try register a new user."""
         try:
-            # 1) first, we get the input.
-            form = self.application.get_register_form()
-            username = form.get('username')
-            password = form.get('password')
-
-            # 2) second, lets hide all messages.
-            self.application.hide_banner()
-            self.application.hide_register_form_error()
+            username, password = self.read_register_form()
 
             # 3) third, lets try register this users.
-            user = self.database.register_user(username, password)
+            tenant = self.router.tenant_for(username)
+            database = self.router.database(tenant, create=True)
+            self.registered(tenant, database.register_user(username, password))
+        except Exception as error:
+            self.register_failed(error)
 
-            # 4) fourth, lets show the home view.
-            self.user = user
-            self.application.show_user_interface_view()
-            self.application.display_success_snack(f'Welcome {username}')
+    @action('complete_all')
+    @batched
+    def complete_all_click(self) -> None:
+        """Will complete every todo of the current user, in one statement."""
+        try:
+            count = self.database.complete_all_todos(self.user.id)
+            self.application.display_success_snack(f'{count} todos completed')
 
-        # ops, some required field is not informed, lets give a feedback.
-        except RequiredField as error:
-            self.application.display_register_form_error(
-                error.field, str(error)
+        except Exception as error:
+            self.application.display_warning_banner(str(error))
+
+    @action('clear_completed')
+    @batched
+    def clear_completed_click(self) -> None:
+        """Will delete the completed todos of the current user."""
+        try:
+            count = self.database.delete_completed_todos(self.user.id)
+            self.application.display_success_snack(f'{count} todos cleared')
+
+        except Exception as error:
+            self.application.display_warning_banner(str(error))
+
+    def progress_reporter(
+        self, verb: str, every: float = 0.5
+    ) -> transfer.Progress:
+        """a progress callback refreshing the ui at most every `every`s."""
+        last = 0.0
+
+        def report(kind: str, count: int) -> None:
+            nonlocal last
+            now = time.monotonic()
+            if now - last >= every:
+                last = now
+                self.application.display_progress(f'{verb} {count} {kind}s')
+
+        return report
+
+    @action('export')
+    def export_click(self, directory: Path, format: str = 'ndjson') -> None:
+        """Will stream every user and todo into `directory`."""
+        try:
+            counts = transfer.export_database(
+                self.database,
+                directory,
+                format,
+                self.progress_reporter('Exported'),
+            )
+            self.application.display_success_snack(
+                f'{counts["todo"]} todos exported'
             )
 
-        # ops, this username is already in use, lets give a feedback.
-        except AlreadyRegistered as error:
-            self.application.display_register_form_error(
-                error.field, str(error)
+        except Exception as error:
+            self.application.display_warning_banner(str(error))
+
+    @action('import')
+    def import_click(self, directory: Path) -> None:
+        """Will load an export from `directory`."""
+        try:
+            counts = transfer.import_database(
+                self.database,
+                directory,
+                progress=self.progress_reporter('Imported'),
+            )
+            self.application.display_success_snack(
+                f'{counts["todo"]} todos imported'
             )
 
-        # ok, some thing really bad hapened.
         except Exception as error:
             self.application.display_warning_banner(str(error))
 
+    @action('restore_session')
+    @batched
+    def restore_session(self) -> bool:
+        """
+        A returning client brings the token of its last login, if it is
+        still valid we go straight to the user interface.
+        """
+        tenant, token = self.stored_session()
+        tokens = self.tokens_for(tenant)
+        user = None if tokens is None else tokens.resolve(token)
+        if user is None:
+            self.application.clear_session_token()
+            return False
+
+        self.tenant = tenant
+        self.user = user
+        self.application.show_user_interface_view()
+        return True
+
+    @batched
     def already_registered_click(self) -> None:
         """nothing in special, just show login view."""
         self.application.show_login_view()
 
+    @batched
     def not_registered_click(self) -> None:
         """nothing in special, just show register view."""
         self.application.show_register_view()
 
+    def flush_writes(self) -> None:
+        self.database.flush()
+
+    def exit_click(self) -> None:
+        """the window is closing, lets write what is still queued first."""
+        self.flush_writes()
+        self.application.close_window()
+
+    @action('logout')
+    @batched
     def logout_click(self) -> None:
         """
         here some things happens.
         all formularies, listviews and others widgets that grabed data stuffs
         are cleaned and our login view will be showed.
         """
+        # queued todo writes (write-behind) must not outlive the session.
+        self.flush_writes()
+        self.tokens.revoke(self.stored_session()[1])
+        self.application.clear_session_token()
         self.application.hide_login_form_error()
         self.application.hide_register_form_error()
         self.application.clear_register_form()
@@ -138,9 +353,93 @@ class Handler:
         self.application.show_login_view()
 
         # lets fill the login form and set our
-        # current user to none.
+        # current user to none (we only keep the password hash,
+        # so the user types the password again).
         if self.user is not None:
-            self.application.set_login_form(
-                self.user.username, self.user.password
-            )
+            self.application.set_login_form(self.user.username, '')
             self.user = None
+        self.tenant = None
+
+
+class AsyncHandler(Handler):
+    """
+    Same events as `Handler`, but the database work of the clicks is done
+    by coroutines backed by `AsyncDataBase` (on the database the router
+    resolves), so flet runs them on its event loop instead of spending a
+    thread per click.
+    """
+
+    asynchronous = True
+
+    @property
+    def async_database(self) -> AsyncDataBase:
+        return get_async_database(self.database)
+
+    @action('login')
+    @batched
+    async def login_click(self) -> None:
+        """Will try login the user."""
+        try:
+            username, password = self.read_login_form()
+            # opening a tenant database blocks, keep it off the event loop.
+            tenant, database = await asyncio.to_thread(
+                self.login_database, username, password
+            )
+            user = await get_async_database(database).login_user(
+                username, password
+            )
+            self.logged_in(tenant, user)
+        except Exception as error:
+            self.login_failed(error)
+
+    @action('register')
+    @batched
+    async def register_click(self) -> None:
+        """Will try register a new user."""
+        try:
+            username, password = self.read_register_form()
+            tenant = self.router.tenant_for(username)
+            # creating a tenant database blocks, keep it off the event loop.
+            database = await asyncio.to_thread(
+                self.router.database, tenant, True
+            )
+            user = await get_async_database(database).register_user(
+                username, password
+            )
+            self.registered(tenant, user)
+        except Exception as error:
+            self.register_failed(error)
+
+    @action('complete_all')
+    @batched
+    async def complete_all_click(self) -> None:
+        """Will complete every todo of the current user, in one statement."""
+        try:
+            count = await self.async_database.complete_all_todos(self.user.id)
+            self.application.display_success_snack(f'{count} todos completed')
+
+        except Exception as error:
+            self.application.display_warning_banner(str(error))
+
+    @action('clear_completed')
+    @batched
+    async def clear_completed_click(self) -> None:
+        """Will delete the completed todos of the current user."""
+        try:
+            count = await self.async_database.delete_completed_todos(
+                self.user.id
+            )
+            self.application.display_success_snack(f'{count} todos cleared')
+
+        except Exception as error:
+            self.application.display_warning_banner(str(error))
+
+    async def export_click(
+        self, directory: Path, format: str = 'ndjson'
+    ) -> None:
+        """Will stream every user and todo, on a worker thread."""
+        await asyncio.to_thread(super().export_click, directory, format)
+
+    async def import_click(self, directory: Path) -> None:
+        """Will load an export, on a worker thread."""
+        await asyncio.to_thread(super().import_click, directory)
@@ -0,0 +1,268 @@
+"""
+What our engines send to the database, and how long it takes.
+
+Every statement is timed through the engine cursor events, and accounted
+to the handler action running it (see `action`), so an action issuing the
+same query over and over (a lazy loaded `User.todos` in a loop, say)
+stands out.
+"""
+# python
+import asyncio
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+# 3rd
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# local
+from src.utils import constants
+
+logger = logging.getLogger(__name__)
+
+# upper bounds (ms) of the latency histogram buckets, the last one is open.
+BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+BACKGROUND = 'background'
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction: float) -> float:
+        """upper bound of the bucket holding that fraction of the values."""
+        seen = 0
+        for bound, count in zip(BUCKETS + (self.max,), self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f'<={bound}' for bound in BUCKETS] + [f'>{BUCKETS[-1]}']
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max, 3),
+            'buckets_ms': dict(zip(labels, self.counts)),
+        }
+
+
+@dataclass
+class ActionRun:
+    name: str
+    queries: int = 0
+    statements: Counter = field(default_factory=Counter)
+    token: Any = None
+
+
+@dataclass
+class ActionStats:
+    runs: int = 0
+    queries: int = 0
+    max_queries: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'runs': self.runs,
+            'queries': self.queries,
+            'queries_per_run': (
+                round(self.queries / self.runs, 2) if self.runs else 0
+            ),
+            'max_queries': self.max_queries,
+        }
+
+
+_current_action: ContextVar[Optional[ActionRun]] = ContextVar(
+    'current_action', default=None
+)
+
+
+class QueryStats:
+    def __init__(
+        self,
+        slow_ms: float = constants.SLOW_QUERY_MS,
+        slow_log_size: int = constants.SLOW_QUERY_LOG_SIZE,
+        repeated: int = constants.REPEATED_QUERY_THRESHOLD,
+    ) -> None:
+        """
+        This class will keep a latency histogram per statement, the
+        queries of each action and the last `slow_log_size` statements
+        slower than `slow_ms`. an action running one statement `repeated`
+        times or more is reported as a possible n+1.
+        """
+        self.slow_ms = slow_ms
+        self.repeated = repeated
+        self.statements: Dict[str, Histogram] = {}
+        self.actions: Dict[str, ActionStats] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=slow_log_size)
+        self.repeated_queries: Deque[Dict[str, Any]] = deque(
+            maxlen=slow_log_size
+        )
+        self.started_at = datetime.utcnow()
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine) -> None:
+        # the start goes on the execution context, a failed statement
+        # (no after event) leaves nothing behind.
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, many):
+            context._query_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, many):
+            started = context._query_started
+            self.record(statement, (time.perf_counter() - started) * 1000)
+
+    def record(self, statement: str, ms: float) -> None:
+        run = _current_action.get()
+        with self._lock:
+            histogram = self.statements.get(statement)
+            if histogram is None:
+                histogram = self.statements[statement] = Histogram()
+            histogram.add(ms)
+            if run is not None:
+                run.queries += 1
+                run.statements[statement] += 1
+            if ms >= self.slow_ms:
+                self.slow_queries.append(
+                    {
+                        'at': datetime.utcnow().isoformat(),
+                        'action': run.name if run else BACKGROUND,
+                        'ms': round(ms, 3),
+                        'statement': statement,
+                    }
+                )
+
+        if ms >= self.slow_ms:
+            logger.warning('Slow query (%.1fms): %s', ms, statement)
+
+    def start(self, name: str) -> ActionRun:
+        run = ActionRun(name)
+        run.token = _current_action.set(run)
+        return run
+
+    def finish(self, run: ActionRun) -> None:
+        _current_action.reset(run.token)
+        with self._lock:
+            stats = self.actions.setdefault(run.name, ActionStats())
+            stats.runs += 1
+            stats.queries += run.queries
+            stats.max_queries = max(stats.max_queries, run.queries)
+            for statement, count in run.statements.items():
+                if count >= self.repeated:
+                    self.repeated_queries.append(
+                        {
+                            'at': datetime.utcnow().isoformat(),
+                            'action': run.name,
+                            'count': count,
+                            'statement': statement,
+                        }
+                    )
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        """Everything as plain data, the slowest statements (total) first."""
+        with self._lock:
+            statements = sorted(
+                self.statements.items(),
+                key=lambda item: item[1].total,
+                reverse=True,
+            )
+            return {
+                'since': self.started_at.isoformat(),
+                'queries': sum(h.count for h in self.statements.values()),
+                'statements': [
+                    {'statement': statement, **histogram.to_dict()}
+                    for statement, histogram in statements[:top]
+                ],
+                'actions': {
+                    name: stats.to_dict()
+                    for name, stats in sorted(self.actions.items())
+                },
+                'slow_queries': list(self.slow_queries),
+                'repeated_queries': list(self.repeated_queries),
+            }
+
+    def dump(self, path: Path = constants.QUERY_STATS_FILE) -> Path:
+        path = Path(path)
+        path.write_text(json.dumps(self.snapshot(top=1000), indent=2))
+        return path
+
+    def reset(self) -> None:
+        with self._lock:
+            self.statements.clear()
+            self.actions.clear()
+            self.slow_queries.clear()
+            self.repeated_queries.clear()
+            self.started_at = datetime.utcnow()
+
+
+_query_stats: Optional[QueryStats] = None
+_query_stats_lock = threading.Lock()
+
+
+def get_query_stats() -> QueryStats:
+    """One collector for every engine of the process."""
+    global _query_stats
+    with _query_stats_lock:
+        if _query_stats is None:
+            _query_stats = QueryStats()
+        return _query_stats
+
+
+class action:
+    """
+    Account the statements run inside to the action `name`, as a `with`
+    block or as a decorator (of plain functions or coroutines).
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._runs: List[ActionRun] = []
+
+    def __enter__(self) -> ActionRun:
+        run = get_query_stats().start(self.name)
+        self._runs.append(run)
+        return run
+
+    def __exit__(self, *exc_info: Any) -> None:
+        get_query_stats().finish(self._runs.pop())
+
+    def __call__(self, function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def run_async(*args: Any, **kwargs: Any) -> Any:
+                with action(self.name):
+                    return await function(*args, **kwargs)
+
+            return run_async
+
+        @wraps(function)
+        def run(*args: Any, **kwargs: Any) -> Any:
+            with action(self.name):
+                return function(*args, **kwargs)
+
+        return run
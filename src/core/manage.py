@@ -0,0 +1,100 @@
+"""
+Maintenance commands for our database.
+
+    python -m src.core.manage rebuild-counters
+    python -m src.core.manage export backup/ --format csv
+    python -m src.core.manage import backup/
+    python -m src.core.manage backup db-copy.sqlite3
+"""
+# python
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+# local
+from src.core import transfer
+from src.core.model import DataBase
+from src.utils import constants
+
+
+def rebuild_counters(database: DataBase, args: argparse.Namespace) -> None:
+    database.rebuild_todo_counters()
+    print('Todo counters rebuilt.')
+
+
+def backup(database: DataBase, args: argparse.Namespace) -> None:
+    print(f'Backed up to {database.backup(args.dest)}.')
+
+
+def print_progress(kind: str, count: int) -> None:
+    print(f'\r{kind}s: {count}', end='', file=sys.stderr, flush=True)
+
+
+def export(database: DataBase, args: argparse.Namespace) -> None:
+    counts = transfer.export_database(
+        database, args.directory, args.format, print_progress
+    )
+    print(file=sys.stderr)
+    print(f'Exported {counts["user"]} users and {counts["todo"]} todos.')
+
+
+def import_(database: DataBase, args: argparse.Namespace) -> None:
+    counts = transfer.import_database(
+        database, args.directory, args.format, print_progress
+    )
+    print(file=sys.stderr)
+    print(f'Imported {counts["user"]} users and {counts["todo"]} todos.')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m src.core.manage')
+    parser.add_argument(
+        '--database',
+        default=constants.DB_URL,
+        help='the database url or sqlite file to work on (default: %(default)s)',
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser(
+        'rebuild-counters', help='recount the todos of every user'
+    )
+    command.set_defaults(run=rebuild_counters)
+
+    command = commands.add_parser(
+        'export', help='stream every user and todo into a directory'
+    )
+    command.add_argument('directory', type=Path)
+    command.add_argument(
+        '--format', choices=transfer.FORMATS, default='ndjson'
+    )
+    command.set_defaults(run=export)
+
+    command = commands.add_parser(
+        'import', help='load an export into the database'
+    )
+    command.add_argument('directory', type=Path)
+    command.add_argument(
+        '--format',
+        choices=transfer.FORMATS,
+        help='guessed from the files by default',
+    )
+    command.set_defaults(run=import_)
+
+    command = commands.add_parser(
+        'backup', help='copy the (sqlite) database while it is in use'
+    )
+    command.add_argument('dest', type=Path)
+    command.set_defaults(run=backup)
+
+    args = parser.parse_args(argv)
+    # no default user, an import may bring its own.
+    database = DataBase(args.database, default_user=False)
+    try:
+        args.run(database, args)
+    finally:
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
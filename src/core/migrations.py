@@ -0,0 +1,243 @@
+"""
+This is our versioned schema.
+
+Every migration runs once, in order, and is recorded in the
+`schema_version` table, so old `db.sqlite3` files get upgraded at startup.
+Migrations must be idempotent: a brand new database gets the whole current
+schema from the first one, and the later ones must then be no-ops.
+"""
+# python
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+# 3rd
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection
+
+version_metadata = MetaData()
+schema_version = Table(
+    'schema_version',
+    version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+Migration = Callable[[Connection, MetaData], None]
+
+
+def create_index(
+    connection: Connection, metadata: MetaData, name: str
+) -> None:
+    for table in metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                index.create(connection, checkfirst=True)
+                return
+
+    raise LookupError(f'Index {name} is not declared in the models.')
+
+
+def create_table(
+    connection: Connection, metadata: MetaData, name: str
+) -> None:
+    metadata.tables[name].create(connection, checkfirst=True)
+
+
+def add_column(
+    connection: Connection, metadata: MetaData, table: str, name: str
+) -> None:
+    """Add a column declared in the models, unless it already exists."""
+    if name in {c['name'] for c in inspect(connection).get_columns(table)}:
+        return
+
+    column = metadata.tables[table].c[name]
+    preparer = connection.dialect.identifier_preparer
+    ddl = (
+        f'ALTER TABLE {preparer.quote(table)} ADD COLUMN '
+        f'{preparer.quote(name)} {column.type.compile(connection.dialect)}'
+    )
+    if column.server_default is not None:
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    connection.execute(text(ddl))
+
+
+def rebuild_todo_counters(connection: Connection, metadata: MetaData) -> None:
+    user = metadata.tables['user']
+    todo = metadata.tables['todo']
+    todos = select(func.count(todo.c.id)).where(todo.c.id_user == user.c.id)
+    connection.execute(
+        update(user).values(
+            todo_count=todos.scalar_subquery(),
+            completed_count=todos.where(
+                todo.c.completed.is_(True)
+            ).scalar_subquery(),
+        )
+    )
+
+
+def initial_schema(connection: Connection, metadata: MetaData) -> None:
+    metadata.create_all(connection)
+
+
+def todo_indexes(connection: Connection, metadata: MetaData) -> None:
+    create_index(connection, metadata, 'ix_todo_id_user_completed')
+
+
+def todo_keyset_index(connection: Connection, metadata: MetaData) -> None:
+    create_index(connection, metadata, 'ix_todo_id_user_id')
+
+
+def session_table(connection: Connection, metadata: MetaData) -> None:
+    create_table(connection, metadata, 'session')
+
+
+def todo_search(connection: Connection, metadata: MetaData) -> None:
+    """
+    Full-text index of the todo descriptions (sqlite fts5, external
+    content), kept in sync by triggers so bulk statements are covered too.
+    postgresql gets a gin index over the same documents instead.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(TODO_SEARCH_POSTGRESQL_DDL))
+        return
+    if connection.dialect.name != 'sqlite':
+        return
+
+    for statement in TODO_SEARCH_DDL:
+        connection.execute(text(statement))
+    # the owner column filters, it must not weigh in the ranking.
+    connection.execute(
+        text("INSERT INTO todo_fts(todo_fts, rank) VALUES ('rank', :rank)"),
+        {'rank': 'bm25(1.0, 0.0)'},
+    )
+    connection.execute(
+        text("INSERT INTO todo_fts(todo_fts) VALUES ('rebuild')")
+    )
+
+
+def todo_search_by_user(connection: Connection, metadata: MetaData) -> None:
+    """
+    Index the owner of each todo too, so a search matches the todos of its
+    user only, instead of ranking everybody's and filtering afterwards.
+    postgresql is left alone, it combines the gin index with the id_user one.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+
+    columns = connection.execute(text('PRAGMA table_info(todo_fts)'))
+    if 'id_user' in {row[1] for row in columns}:
+        return
+
+    for statement in DROP_TODO_SEARCH_DDL:
+        connection.execute(text(statement))
+    todo_search(connection, metadata)
+
+
+TODO_SEARCH_POSTGRESQL_DDL = """
+    CREATE INDEX IF NOT EXISTS ix_todo_description_search ON todo
+    USING gin (to_tsvector('simple', description))
+"""
+
+TODO_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todo_fts USING fts5(
+        description,
+        id_user,
+        content='todo',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_fts_insert AFTER INSERT ON todo BEGIN
+        INSERT INTO todo_fts(rowid, description, id_user)
+        VALUES (new.id, new.description, new.id_user);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_fts_delete AFTER DELETE ON todo BEGIN
+        INSERT INTO todo_fts(todo_fts, rowid, description, id_user)
+        VALUES ('delete', old.id, old.description, old.id_user);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_fts_update
+    AFTER UPDATE OF description, id_user ON todo BEGIN
+        INSERT INTO todo_fts(todo_fts, rowid, description, id_user)
+        VALUES ('delete', old.id, old.description, old.id_user);
+        INSERT INTO todo_fts(rowid, description, id_user)
+        VALUES (new.id, new.description, new.id_user);
+    END
+    """,
+]
+
+DROP_TODO_SEARCH_DDL = [
+    'DROP TRIGGER IF EXISTS todo_fts_insert',
+    'DROP TRIGGER IF EXISTS todo_fts_delete',
+    'DROP TRIGGER IF EXISTS todo_fts_update',
+    'DROP TABLE IF EXISTS todo_fts',
+]
+
+
+def todo_counters(connection: Connection, metadata: MetaData) -> None:
+    add_column(connection, metadata, 'user', 'todo_count')
+    add_column(connection, metadata, 'user', 'completed_count')
+    rebuild_todo_counters(connection, metadata)
+
+
+MIGRATIONS: List[Tuple[int, str, Migration]] = [
+    (1, 'initial schema', initial_schema),
+    (2, 'todo (id_user, completed) index', todo_indexes),
+    (3, 'todo (id_user, id) index', todo_keyset_index),
+    (4, 'session table', session_table),
+    (5, 'todo full-text search', todo_search),
+    (6, 'user todo counters', todo_counters),
+    (7, 'todo full-text search by user', todo_search_by_user),
+]
+
+
+def current_version(connection: Connection) -> int:
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+
+    version = connection.scalar(select(func.max(schema_version.c.version)))
+    return version or 0
+
+
+def upgrade(connection: Connection, metadata: MetaData) -> int:
+    """Apply the pending migrations, returns the new schema version."""
+    version_metadata.create_all(connection)
+    version = current_version(connection)
+
+    for number, description, migration in MIGRATIONS:
+        if number <= version:
+            continue
+
+        migration(connection, metadata)
+        connection.execute(
+            insert(schema_version).values(
+                version=number,
+                description=description,
+                applied_at=datetime.utcnow(),
+            )
+        )
+        version = number
+
+    return version
@@ -2,30 +2,90 @@
 This is or model layer.
 """
 # python
-from typing import List, Optional
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 # 3rd
 from sqlalchemy import (
     Boolean,
     Column,
+    DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
+    column,
     create_engine,
+    delete,
+    event,
+    func,
+    insert,
+    literal_column,
+    select,
+    table,
+    text,
+    update,
 )
+from sqlalchemy.engine import URL, Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import (
+    ORMExecuteState,
     Session,
     declarative_base,
+    joinedload,
     relationship,
+    scoped_session,
+    selectinload,
     sessionmaker,
 )
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Select, Update
 
 # local
+from src.core import migrations
+from src.core.backup import SnapshotScheduler, online_backup
+from src.core.cache import LRUCache
+from src.core.instrumentation import get_query_stats
+from src.core.security import PasswordHasher, get_password_hasher
+from src.core.tokens import SessionTokens
+from src.core.write_behind import WriteBehindQueue
 from src.utils import constants
 
+if TYPE_CHECKING:
+    from src.core.async_model import AsyncDataBase
+
 Base = declarative_base()
 
+# ids per `IN (...)` of the bulk statements, far below sqlite variable limit.
+BULK_CHUNK_SIZE = 500
+# what `export_rows` streams of each table (and `import_rows` takes back),
+# the counters are not there, they are rebuilt after an import.
+EXPORT_FIELDS = {
+    'user': ('id', 'username', 'password'),
+    'todo': ('id', 'description', 'completed', 'id_user'),
+}
+
 
 class RequiredField(Exception):
     def __init__(self, field: str) -> None:
@@ -43,12 +103,21 @@ class NotRegistered(Exception):
     pass
 
 
+class LazyLoadError(Exception):
+    pass
+
+
 class User(Base):
     __tablename__ = 'user'
 
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)
     password = Column(String, nullable=False)
+    # kept by the database write methods, see `DataBase.todo_counters`.
+    todo_count = Column(Integer, nullable=False, default=0, server_default='0')
+    completed_count = Column(
+        Integer, nullable=False, default=0, server_default='0'
+    )
     todos = relationship('Todo', back_populates='user')
 
     def __repr__(self) -> str:
@@ -57,6 +126,12 @@ class User(Base):
 
 class Todo(Base):
     __tablename__ = 'todo'
+    __table_args__ = (
+        # the todos of an user, optionally by state, never scan the table.
+        Index('ix_todo_id_user_completed', 'id_user', 'completed'),
+        # keyset pagination walks the todos of an user in id order.
+        Index('ix_todo_id_user_id', 'id_user', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable=False)
@@ -68,21 +143,379 @@ class Todo(Base):
         return f'<Todo description: {self.description},  completed: {self.completed}>'
 
 
+class AuthSession(Base):
+    __tablename__ = 'session'
+
+    id = Column(Integer, primary_key=True)
+    token_digest = Column(String, unique=True, nullable=False)
+    id_user = Column(
+        Integer, ForeignKey('user.id'), nullable=False, index=True
+    )
+    expires_at = Column(DateTime, nullable=False)
+    user = relationship('User')
+
+    def __repr__(self) -> str:
+        return f'<AuthSession id_user: {self.id_user}, expires_at: {self.expires_at}>'
+
+
+# the fts5 table (see migrations.todo_search), it is not a model.
+todo_fts = table('todo_fts', column('rowid'), column('rank'))
+
+
+def change_todo_counters(
+    id_user: int, total: int = 0, completed: int = 0
+) -> Update:
+    return (
+        update(User)
+        .where(User.id == id_user)
+        .values(
+            todo_count=User.todo_count + total,
+            completed_count=User.completed_count + completed,
+        )
+    )
+
+
+def todo_row(todo: 'Todo') -> tuple:
+    return tuple(getattr(todo, field) for field in EXPORT_FIELDS['todo'])
+
+
+def todo_from_row(row: tuple) -> 'Todo':
+    """
+    A new detached todo, as if just loaded by an unit of work. built the
+    way the orm loads one, `Todo(...)` would record every column as a change
+    and cost ten times more.
+    """
+    todo = Todo._sa_class_manager.new_instance()
+    instance_state(todo).key = Todo.__mapper__.identity_key_from_primary_key(
+        row[:1]
+    )
+    todo.__dict__.update(zip(EXPORT_FIELDS['todo'], row))
+    return todo
+
+
+def search_expression(query: str) -> Optional[str]:
+    """
+    Turn what the user typed into a fts5 query: every word must match,
+    as a prefix. the words are quoted, so fts5 syntax is never interpreted.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def tsquery_expression(query: str) -> Optional[str]:
+    """
+    The postgresql `to_tsquery` flavour of `search_expression`. underscores
+    split words there too, so they are never part of one.
+    """
+    words = re.findall(r'[^\W_]+', query)
+    if not words:
+        return None
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def fts5_search(id_user: int, query: str) -> Optional[Select]:
+    """
+    The todos of an user matching `query`, on the sqlite fts5 table. the
+    owner is part of the match, only the todos of the user get ranked.
+    """
+    expression = search_expression(query)
+    if expression is None:
+        return None
+
+    expression = f'id_user : "{int(id_user)}" AND description : ({expression})'
+    return (
+        select(Todo)
+        .join(todo_fts, todo_fts.c.rowid == Todo.id)
+        .where(
+            text('todo_fts MATCH :expression').bindparams(
+                expression=expression
+            )
+        )
+        .order_by(todo_fts.c.rank)
+    )
+
+
+def tsvector_search(id_user: int, query: str) -> Optional[Select]:
+    """The same, on postgresql full-text search."""
+    expression = tsquery_expression(query)
+    if expression is None:
+        return None
+
+    # the very expression of the gin index (see migrations.todo_search).
+    document = func.to_tsvector(literal_column("'simple'"), Todo.description)
+    tsquery = func.to_tsquery(literal_column("'simple'"), expression)
+    return (
+        select(Todo)
+        .where(document.op('@@')(tsquery), Todo.id_user == id_user)
+        .order_by(func.ts_rank(document, tsquery).desc(), Todo.id)
+    )
+
+
+# set inside `no_lazy_loads`, checked by strict loading databases.
+_lazy_loads_forbidden: ContextVar[bool] = ContextVar(
+    'lazy_loads_forbidden', default=False
+)
+
+
+@contextmanager
+def no_lazy_loads() -> Iterator[None]:
+    """
+    Mark a list rendering code path (as a `with` block or a decorator).
+    with strict loading (see `DataBase`) a lazy load inside raises
+    `LazyLoadError`: one query per row, use an eager read instead.
+    """
+    token = _lazy_loads_forbidden.set(True)
+    try:
+        yield
+    finally:
+        _lazy_loads_forbidden.reset(token)
+
+
+def check_lazy_load(state: ORMExecuteState) -> None:
+    if not (_lazy_loads_forbidden.get() and state.is_select):
+        return
+    if state.lazy_loaded_from is None:
+        return
+
+    path = state.loader_strategy_path
+    raise LazyLoadError(f'Lazy load of {path[-1]} while rendering a list.')
+
+
+def get_engine_profile(
+    profile: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    if profile is None:
+        profile = dict(
+            constants.DB_ENGINE_PROFILES[constants.DB_ENGINE_PROFILE]
+        )
+        if constants.DB_POOL_SIZE is not None:
+            profile['pool_size'] = int(constants.DB_POOL_SIZE)
+        if constants.DB_MAX_OVERFLOW is not None:
+            profile['max_overflow'] = int(constants.DB_MAX_OVERFLOW)
+    return profile
+
+
+def database_url(db_name: Union[str, URL]) -> URL:
+    """`db_name` is either an engine url or the path of a sqlite file."""
+    if isinstance(db_name, URL):
+        return db_name
+    if '://' in str(db_name):
+        return make_url(str(db_name))
+    return make_url(f'sqlite:///{db_name}')
+
+
+def listen_sqlite_pragmas(engine: Engine, pragmas: Dict[str, Any]) -> None:
+    """Run the profile pragmas on every new sqlite connection."""
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def create_database_engine(
+    db_name: str, profile: Optional[Dict[str, Any]] = None
+) -> Engine:
+    """
+    Build the engine for `db_name` (see `database_url`) using one of the
+    `constants.DB_ENGINE_PROFILES` (the configured one by default).
+    """
+    profile = get_engine_profile(profile)
+    url = database_url(db_name)
+    options: Dict[str, Any] = {}
+    pragmas = profile.get('pragmas', {})
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {
+            'timeout': pragmas.get('busy_timeout', 5000) / 1000,
+            'check_same_thread': False,
+        }
+
+    engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=profile.get('pool_size', 5),
+        max_overflow=profile.get('max_overflow', 10),
+        pool_timeout=profile.get('pool_timeout', 30),
+        pool_recycle=profile.get('pool_recycle', -1),
+        pool_pre_ping=profile.get('pool_pre_ping', False),
+        **options,
+    )
+    if url.get_backend_name() == 'sqlite':
+        listen_sqlite_pragmas(engine, pragmas)
+
+    return engine
+
+
 class DataBase:
-    def __init__(self, db_name: str) -> None:
+    def __init__(
+        self,
+        db_name: str,
+        profile: Optional[Dict[str, Any]] = None,
+        hasher: Optional[PasswordHasher] = None,
+        write_behind: bool = constants.WRITE_BEHIND,
+        default_user: bool = True,
+        snapshots: bool = constants.SNAPSHOT_INTERVAL > 0,
+        strict_loading: bool = constants.STRICT_LOADING,
+    ) -> None:
         """This class will configure our database."""
-        engine = create_engine(f'sqlite:///{db_name}')
-        Base.metadata.create_all(engine)
-        Session = sessionmaker(engine)
-        self.session = Session()
-        self.create_default_user()
+        self.hasher = hasher or get_password_hasher()
+        self.todo_cache = LRUCache(constants.TODO_CACHE_SIZE)
+        self.profile = get_engine_profile(profile)
+        self.engine = create_database_engine(db_name, self.profile)
+        if constants.QUERY_STATS:
+            get_query_stats().attach(self.engine)
+        with self.engine.begin() as connection:
+            migrations.upgrade(connection, Base.metadata)
+
+        # each thread (flet dispatches events on its own threads) gets its
+        # own short-lived session, opened and closed by `session_scope`.
+        factory = sessionmaker(self.engine, expire_on_commit=False)
+        if strict_loading:
+            event.listen(factory, 'do_orm_execute', check_lazy_load)
+        self.Session = scoped_session(factory)
+        if default_user:
+            self.create_default_user()
+        self.tokens = SessionTokens(self)
+
+        # todo writes may be queued and group committed (see `flush`).
+        self.write_behind: Optional[WriteBehindQueue] = None
+        if write_behind:
+            self.write_behind = WriteBehindQueue(self)
+
+        # and backed up on a schedule (see `backup`), sqlite only.
+        self.snapshots: Optional[SnapshotScheduler] = None
+        if snapshots and self.engine.dialect.name == 'sqlite':
+            self.snapshots = SnapshotScheduler(self)
+
+        # the asyncio flavour of this very database, made on first use (see
+        # `async_model.get_async_database`) and closed with it.
+        self.async_twin: Optional['AsyncDataBase'] = None
+
+    @contextmanager
+    def session_scope(self) -> Iterator[Session]:
+        """
+        One unit of work: commit on success, rollback on error, then close.
+        nested scopes on the same thread join the outermost one, so only
+        the outermost scope commits.
+        """
+        if self.Session.registry.has():
+            yield self.Session()
+            return
+
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+            callbacks = session.info.pop('on_commit', [])
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            self.Session.remove()
+
+        for callback in callbacks:
+            callback()
+
+    def on_commit(self, session: Session, callback: Callable[[], Any]) -> None:
+        """Run `callback` once the unit of work of `session` is committed."""
+        session.info.setdefault('on_commit', []).append(callback)
+
+    def invalidate_todos(self, session: Session, *id_users: int) -> None:
+        """the todos of these users changed, drop their cached reads."""
+        for id_user in set(id_users):
+            self.on_commit(
+                session, partial(self.todo_cache.invalidate, id_user)
+            )
+
+    def cached_todos(
+        self, key: Hashable, id_user: int, load: Callable[[], List['Todo']]
+    ) -> List['Todo']:
+        """
+        Read todos of an user through `todo_cache`. inside an open unit of
+        work we read straight from it, it may hold uncommitted changes.
+
+        the cache keeps rows, every read gets todos of its own: a caller
+        changing one doesn't change what the next read returns.
+        """
+        if self.Session.registry.has():
+            return load()
+
+        rows = self.todo_cache.get(key)
+        if rows is None:
+            generation = self.todo_cache.generation(id_user)
+            todos = load()
+            self.todo_cache.set(
+                key,
+                tuple(todo_row(todo) for todo in todos),
+                group=id_user,
+                generation=generation,
+            )
+            return todos
+
+        return [todo_from_row(row) for row in rows]
+
+    def count_todos(
+        self, session: Session, id_user: int, total: int, completed: int
+    ) -> None:
+        """Move the todo counters of an user, in the running unit of work."""
+        if id_user is not None and (total or completed):
+            session.execute(change_todo_counters(id_user, total, completed))
+
+    def todo_counters(self, id_user: int) -> Tuple[int, int]:
+        """How many todos an user has, and how many are completed."""
+        self.flush()
+        query = select(User.todo_count, User.completed_count).where(
+            User.id == id_user
+        )
+        with self.session_scope() as session:
+            row = session.execute(query).first()
+            return (0, 0) if row is None else (row[0], row[1])
+
+    def rebuild_todo_counters(self) -> None:
+        """Recount the todos of every user, repairing any drift."""
+        self.flush()
+        with self.session_scope() as session:
+            migrations.rebuild_todo_counters(
+                session.connection(), Base.metadata
+            )
+
+    def flush(self) -> None:
+        """Write the queued todo writes now, if we are in write-behind."""
+        if self.write_behind is not None:
+            self.write_behind.flush()
+
+    def backup(self, dest: Path) -> Path:
+        """
+        Copy the database into `dest` while it is in use (see
+        `backup.online_backup`), queued writes included.
+        """
+        self.flush()
+        return online_backup(self.engine, dest)
+
+    def close(self) -> None:
+        if self.snapshots is not None:
+            self.snapshots.close()
+        if self.write_behind is not None:
+            self.write_behind.close()
+        if self.async_twin is not None:
+            self.async_twin.dispose()
+            self.async_twin = None
+        self.Session.remove()
+        self.engine.dispose()
 
     def create_default_user(self) -> None:
         username = constants.DEFAULT_USERNAME
         password = constants.DEFAULT_PASSWORD
-        if not self.filter_users(username=username):
-            user = User(username=username, password=password)
-            self.insert_user(user)
+        with self.session_scope():
+            if not self.filter_users(username=username):
+                user = User(
+                    username=username, password=self.hasher.hash(password)
+                )
+                self.insert_user(user)
 
     def insert_user(self, user: 'User') -> None:
         if user.username is None:
@@ -91,18 +524,27 @@ class DataBase:
         elif user.password is None:
             raise RequiredField('password')
 
-        elif self.filter_users(username=user.username):
-            raise AlreadyRegistered('username')
+        with self.session_scope() as session:
+            if self.filter_users(username=user.username):
+                raise AlreadyRegistered('username')
 
-        self.session.add(user)
-        self.session.commit()
+            session.add(user)
 
     def insert_todo(self, todo: 'Todo') -> None:
         if todo.description is None:
             raise RequiredField('description')
 
-        self.session.add(todo)
-        self.session.commit()
+        if self.write_behind is not None and self.write_behind.defer(
+            ('insert', id(todo)), partial(self.insert_todo, todo)
+        ):
+            return
+
+        with self.session_scope() as session:
+            session.add(todo)
+            self.count_todos(
+                session, todo.id_user, 1, int(bool(todo.completed))
+            )
+            self.invalidate_todos(session, todo.id_user)
 
     def update_todo(self, todo: 'Todo') -> None:
         if todo.description is None:
@@ -111,33 +553,308 @@ class DataBase:
         if todo.completed is None:
             raise RequiredField('completed')
 
-        self.session.commit()
+        if self.write_behind is not None and self.write_behind.defer(
+            ('update', todo.id or id(todo)), partial(self.update_todo, todo)
+        ):
+            return
+
+        # the todo usually comes detached from an earlier unit of work.
+        with self.session_scope() as session:
+            stored = None if todo.id is None else session.get(Todo, todo.id)
+            if stored is not None:
+                id_user, completed = stored.id_user, int(stored.completed)
+                self.count_todos(session, id_user, -1, -completed)
+                self.invalidate_todos(session, id_user)
+            session.merge(todo)
+            self.count_todos(session, todo.id_user, 1, int(todo.completed))
+            self.invalidate_todos(session, todo.id_user)
+
+    def update_user_password(self, user: 'User') -> None:
+        with self.session_scope() as session:
+            session.execute(
+                update(User)
+                .where(User.id == user.id)
+                .values(password=user.password)
+            )
+
+    def insert_auth_session(
+        self, token_digest: str, user: 'User', expires_at: datetime
+    ) -> None:
+        with self.session_scope() as session:
+            session.add(
+                AuthSession(
+                    token_digest=token_digest,
+                    id_user=user.id,
+                    expires_at=expires_at,
+                )
+            )
+
+    def select_auth_session(
+        self, token_digest: str
+    ) -> Optional[Tuple['User', datetime]]:
+        query = (
+            select(User, AuthSession.expires_at)
+            .join(AuthSession, AuthSession.id_user == User.id)
+            .where(AuthSession.token_digest == token_digest)
+        )
+        with self.session_scope() as session:
+            row = session.execute(query).first()
+            return None if row is None else (row[0], row[1])
+
+    def delete_auth_session(self, token_digest: str) -> None:
+        with self.session_scope() as session:
+            session.execute(
+                delete(AuthSession).where(
+                    AuthSession.token_digest == token_digest
+                )
+            )
+
+    def delete_expired_auth_sessions(self, id_user: int) -> None:
+        with self.session_scope() as session:
+            session.execute(
+                delete(AuthSession).where(
+                    AuthSession.id_user == id_user,
+                    AuthSession.expires_at <= datetime.utcnow(),
+                )
+            )
 
     def delete_user(self, user: 'User') -> None:
-        self.session.delete(user)
-        self.session.commit()
+        self.flush()
+        with self.session_scope() as session:
+            # its sessions go first, they point to it.
+            session.execute(
+                delete(AuthSession).where(AuthSession.id_user == user.id)
+            )
+            session.delete(session.merge(user))
+            self.invalidate_todos(session, user.id)
+            self.on_commit(session, partial(self.tokens.forget_user, user.id))
 
     def delete_todo(self, todo: 'Todo') -> None:
-        self.session.delete(todo)
-        self.session.commit()
-
-    def select_users(self) -> List['User']:
-        return self.session.query(User).all()
-
-    def select_todos(self) -> List['Todo']:
-        return self.session.query(Todo).all()
-
-    def select_user_by_id(self, id: int) -> Optional['User']:
-        return self.session.query(User).filter(User.id == id).first()
+        if self.write_behind is not None and self.write_behind.defer(
+            ('delete', todo.id or id(todo)), partial(self.delete_todo, todo)
+        ):
+            return
+
+        with self.session_scope() as session:
+            # count what is stored, not what the detached todo says.
+            stored = session.get(Todo, todo.id)
+            if stored is None:
+                return
+
+            session.delete(stored)
+            id_user, completed = stored.id_user, int(stored.completed)
+            self.count_todos(session, id_user, -1, -completed)
+            self.invalidate_todos(session, id_user)
+
+    def select_users(self, with_todos: bool = False) -> List['User']:
+        """`with_todos` loads the todos of all of them in one more query."""
+        query = select(User)
+        if with_todos:
+            # the todos queued in write-behind are part of them.
+            self.flush()
+            query = query.options(selectinload(User.todos))
+        with self.session_scope() as session:
+            return list(session.scalars(query))
+
+    def select_todos(self, with_user: bool = False) -> List['Todo']:
+        """`with_user` joins the owner of each todo in the same query."""
+        self.flush()
+        query = select(Todo)
+        if with_user:
+            query = query.options(joinedload(Todo.user))
+        with self.session_scope() as session:
+            return list(session.scalars(query))
+
+    def select_user_by_id(
+        self, id: int, with_todos: bool = False
+    ) -> Optional['User']:
+        query = select(User).where(User.id == id)
+        if with_todos:
+            # the todos queued in write-behind are part of them.
+            self.flush()
+            query = query.options(selectinload(User.todos))
+        with self.session_scope() as session:
+            return session.scalars(query).first()
 
     def select_todo_by_id(self, id: int) -> Optional['Todo']:
-        return self.session.query(Todo).filter(Todo.id == id).first()
-
-    def filter_users(self, **values) -> List['User']:
-        return self.session.query(User).filter_by(**values).all()
+        self.flush()
+        with self.session_scope() as session:
+            return session.query(Todo).filter(Todo.id == id).first()
+
+    def filter_users(self, with_todos: bool = False, **values) -> List['User']:
+        query = select(User).filter_by(**values)
+        if with_todos:
+            # the todos queued in write-behind are part of them.
+            self.flush()
+            query = query.options(selectinload(User.todos))
+        with self.session_scope() as session:
+            return list(session.scalars(query))
+
+    def filter_todos(self, with_user: bool = False, **values) -> List['Todo']:
+        self.flush()
+        query = select(Todo).filter_by(**values)
+        if with_user:
+            query = query.options(joinedload(Todo.user))
+
+        def load() -> List['Todo']:
+            with self.session_scope() as session:
+                return list(session.scalars(query))
+
+        # the todos of an user (by state, maybe) are the hot path. their
+        # owner is known already, so `with_user` reads are not cached.
+        if (
+            not with_user
+            and 'id_user' in values
+            and set(values) <= {'id_user', 'completed'}
+        ):
+            key = ('filter', tuple(sorted(values.items())))
+            return self.cached_todos(key, values['id_user'], load)
+
+        return load()
+
+    def page_todos(
+        self, id_user: int, after_id: Optional[int] = None, limit: int = 50
+    ) -> List['Todo']:
+        """
+        One page of the todos of an user, in id order. pass the id of the
+        last todo of a page as `after_id` to get the next one.
+        """
+        self.flush()
+        query = select(Todo).where(Todo.id_user == id_user)
+        if after_id is not None:
+            query = query.where(Todo.id > after_id)
+        query = query.order_by(Todo.id).limit(limit)
+
+        def load() -> List['Todo']:
+            with self.session_scope() as session:
+                return list(session.scalars(query))
+
+        key = ('page', id_user, after_id, limit)
+        return self.cached_todos(key, id_user, load)
+
+    def search_todos(
+        self, id_user: int, query: str, limit: int = 20
+    ) -> List['Todo']:
+        """The todos of an user matching `query`, best matches first."""
+        self.flush()
+        if self.engine.dialect.name == 'postgresql':
+            statement = tsvector_search(id_user, query)
+        else:
+            statement = fts5_search(id_user, query)
+        if statement is None:
+            return []
+
+        statement = statement.limit(limit)
+        with self.session_scope() as session:
+            return list(session.scalars(statement))
+
+    def iter_todos(
+        self, id_user: Optional[int] = None, batch_size: int = 500
+    ) -> Iterator['Todo']:
+        """
+        Stream todos (all of them or the ones of an user) in id order,
+        fetching `batch_size` rows at a time. they come from a session of
+        their own (not the unit of work of the thread), open until the
+        iterator is exhausted or closed: what the caller writes meanwhile
+        commits on its own.
+        """
+        self.flush()
+        query = select(Todo).order_by(Todo.id)
+        if id_user is not None:
+            query = query.where(Todo.id_user == id_user)
+        query = query.execution_options(yield_per=batch_size)
+
+        with self.Session.session_factory() as session:
+            for partition in session.scalars(query).partitions():
+                for todo in partition:
+                    # don't let the identity map grow with the stream.
+                    session.expunge(todo)
+                    yield todo
+
+    def export_rows(
+        self, kind: str, batch_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the rows of `kind` (see `EXPORT_FIELDS`) as dicts, in id
+        order, `batch_size` rows in memory at a time. on a connection of
+        their own, like `iter_todos`.
+        """
+        self.flush()
+        table = Base.metadata.tables[kind]
+        query = (
+            select(*(table.c[field] for field in EXPORT_FIELDS[kind]))
+            .order_by(table.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        with self.engine.connect() as connection:
+            for row in connection.execute(query):
+                yield dict(row._mapping)
 
-    def filter_todos(self, **values) -> List['Todo']:
-        return self.session.query(Todo).filter_by(**values).all()
+    def import_rows(
+        self,
+        kind: str,
+        rows: Iterable[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        progress: Optional[Callable[[int], Any]] = None,
+        user_ids: Optional[Dict[int, int]] = None,
+    ) -> int:
+        """
+        Insert exported rows of `kind` under new ids, with one executemany
+        and one transaction per chunk. `progress` gets the number of rows
+        imported so far after every chunk.
+
+        an user already here (by username) is kept as it is, not imported
+        again. `user_ids` gets where every exported user id ended up, and
+        the owners of the todos are mapped with it (ids not in it are kept).
+        """
+        self.flush()
+        table = Base.metadata.tables[kind]
+        fields = [field for field in EXPORT_FIELDS[kind] if field != 'id']
+        user_ids = {} if user_ids is None else user_ids
+        rows = iter(rows)
+        count = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            values = [
+                {field: row.get(field) for field in fields} for row in chunk
+            ]
+            with self.session_scope() as session:
+                if kind == 'user':
+                    by_username = select(User.username, User.id).where(
+                        User.username.in_(row['username'] for row in values)
+                    )
+                    existing = dict(session.execute(by_username).all())
+                    values = [
+                        row
+                        for row in values
+                        if row['username'] not in existing
+                    ]
+                    if values:
+                        session.execute(insert(table), values)
+                    ids = dict(session.execute(by_username).all())
+                    for row in chunk:
+                        user_ids[row['id']] = ids[row['username']]
+                else:
+                    for row in values:
+                        row['id_user'] = user_ids.get(
+                            row['id_user'], row['id_user']
+                        )
+                    session.execute(insert(table), values)
+            count += len(chunk)
+            if progress is not None:
+                progress(count)
+
+        # the counters are not in the file.
+        with self.session_scope() as session:
+            migrations.rebuild_todo_counters(
+                session.connection(), Base.metadata
+            )
+        self.todo_cache.clear()
+
+        return count
 
     def register_user(
         self, username: Optional[str], password: Optional[str]
@@ -148,10 +865,7 @@ class DataBase:
         if password is None:
             raise RequiredField('password')
 
-        if self.filter_users(username=username):
-            raise AlreadyRegistered('username')
-
-        user = User(username=username, password=password)
+        user = User(username=username, password=self.hasher.hash(password))
         self.insert_user(user)
 
         return user
@@ -165,11 +879,22 @@ class DataBase:
         if password is None:
             raise RequiredField('password')
 
-        users = self.filter_users(username=username, password=password)
+        # lookup by the (unique, so indexed) username only. an unknown
+        # one costs a verify too, the timing mustn't tell it apart.
+        users = self.filter_users(username=username)
         if not users:
+            self.hasher.verify_unknown(password)
             raise NotRegistered('Invalid username or password')
-        else:
-            return users[0]
+        if not self.hasher.verify(password, users[0].password):
+            raise NotRegistered('Invalid username or password')
+
+        # upgrade plaintext (or outdated) hashes, now that we know it.
+        user = users[0]
+        if self.hasher.needs_rehash(user.password):
+            user.password = self.hasher.hash(password)
+            self.update_user_password(user)
+
+        return user
 
     def register_todo(
         self,
@@ -192,3 +917,106 @@ class DataBase:
         self.insert_todo(todo)
 
         return todo
+
+    def bulk_register_todos(self, todos: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert many todos (dicts with description, completed and id_user)
+        with a single executemany, returns how many were inserted.
+        """
+        self.flush()
+        rows = []
+        for values in todos:
+            for field in ('description', 'completed', 'id_user'):
+                if values.get(field) is None:
+                    raise RequiredField(field)
+
+            rows.append(
+                {
+                    'description': values['description'],
+                    'completed': values['completed'],
+                    'id_user': values['id_user'],
+                }
+            )
+
+        if not rows:
+            return 0
+
+        totals = Counter(row['id_user'] for row in rows)
+        completed = Counter(row['id_user'] for row in rows if row['completed'])
+        with self.session_scope() as session:
+            session.execute(insert(Todo), rows)
+            for id_user, total in totals.items():
+                self.count_todos(session, id_user, total, completed[id_user])
+            self.invalidate_todos(session, *totals)
+
+        return len(rows)
+
+    def mark_todos_completed(
+        self, ids: Iterable[int], completed: bool = True
+    ) -> int:
+        """Set the state of many todos at once, returns how many changed."""
+        self.flush()
+        ids = list(ids)
+        count = 0
+        with self.session_scope() as session:
+            for start in range(0, len(ids), BULK_CHUNK_SIZE):
+                chunk = ids[start : start + BULK_CHUNK_SIZE]
+                # returning tells us whose todos really changed.
+                changed = Counter(
+                    session.scalars(
+                        update(Todo)
+                        .where(Todo.id.in_(chunk), Todo.completed != completed)
+                        .values(completed=completed)
+                        .returning(Todo.id_user)
+                        .execution_options(synchronize_session=False)
+                    )
+                )
+                for id_user, total in changed.items():
+                    delta = total if completed else -total
+                    self.count_todos(session, id_user, 0, delta)
+                self.invalidate_todos(session, *changed)
+                count += sum(changed.values())
+
+        return count
+
+    def complete_all_todos(self, id_user: int) -> int:
+        self.flush()
+        with self.session_scope() as session:
+            result = session.execute(
+                update(Todo)
+                .where(Todo.id_user == id_user, Todo.completed.is_(False))
+                .values(completed=True)
+                .execution_options(synchronize_session=False)
+            )
+            self.count_todos(session, id_user, 0, result.rowcount)
+            self.invalidate_todos(session, id_user)
+            return result.rowcount
+
+    def delete_completed_todos(self, id_user: int) -> int:
+        self.flush()
+        with self.session_scope() as session:
+            result = session.execute(
+                delete(Todo)
+                .where(Todo.id_user == id_user, Todo.completed.is_(True))
+                .execution_options(synchronize_session=False)
+            )
+            count = result.rowcount
+            self.count_todos(session, id_user, -count, -count)
+            self.invalidate_todos(session, id_user)
+            return count
+
+
+_databases: Dict[str, DataBase] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_name: str) -> DataBase:
+    """
+    Every flet session (one per browser tab in web mode) builds its own
+    handler, but they all share one `DataBase` and its connection pool.
+    """
+    key = str(db_name)
+    with _databases_lock:
+        if key not in _databases:
+            _databases[key] = DataBase(db_name)
+        return _databases[key]
@@ -0,0 +1,141 @@
+"""
+Login throttling, so scripted attempts never reach the database.
+"""
+# python
+import math
+import threading
+import time
+from typing import Dict, Hashable, List, Optional
+
+# local
+from src.utils import constants
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float) -> None:
+        self.retry_after = retry_after
+        super().__init__(
+            f'Too many attempts, try again in {math.ceil(retry_after)} seconds.'
+        )
+
+
+class SlidingWindowLimiter:
+    def __init__(self, limit: int, window: float, sweep_every: int = 1000):
+        """
+        Allow `limit` hits per key in any `window` seconds.
+
+        the window slides by weighting the count of the previous fixed
+        window with how much of it still overlaps, so every key costs three
+        numbers and every hit is O(1). idle keys are swept every
+        `sweep_every` hits.
+        """
+        self.limit = limit
+        self.window = window
+        self.sweep_every = sweep_every
+        # key -> [start of the current window, current count, previous count]
+        self._counters: Dict[Hashable, List[float]] = {}
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def _counter(self, key: Hashable, now: float) -> List[float]:
+        start = now - now % self.window
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = [start, 0, 0]
+        elif counter[0] != start:
+            # the current window became the previous one, unless it's older.
+            elapsed = (start - counter[0]) // self.window
+            counter[2] = counter[1] if elapsed == 1 else 0
+            counter[1] = 0
+            counter[0] = start
+        return counter
+
+    def hit(self, key: Hashable) -> Optional[float]:
+        """Count a hit, returns the seconds to wait if it's over the limit."""
+        now = time.monotonic()
+        with self._lock:
+            self._hits += 1
+            if self._hits % self.sweep_every == 0:
+                self.sweep(now)
+
+            counter = self._counter(key, now)
+            overlap = 1 - (now - counter[0]) / self.window
+            if counter[2] * overlap + counter[1] >= self.limit:
+                return counter[0] + self.window - now
+
+            counter[1] += 1
+            return None
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def sweep(self, now: float) -> None:
+        """Drop the keys without hits in the last two windows."""
+        oldest = now - now % self.window - self.window
+        for key in [k for k, c in self._counters.items() if c[0] < oldest]:
+            del self._counters[key]
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+class LoginRateLimiter:
+    def __init__(
+        self,
+        username_limit: int = constants.LOGIN_RATE_LIMIT_USERNAME,
+        client_limit: int = constants.LOGIN_RATE_LIMIT_CLIENT,
+        window: float = constants.LOGIN_RATE_LIMIT_WINDOW,
+    ) -> None:
+        """This class will throttle logins by username and by client ip."""
+        self.usernames = SlidingWindowLimiter(username_limit, window)
+        self.clients = SlidingWindowLimiter(client_limit, window)
+        self.allowed = 0
+        self.throttled_usernames = 0
+        self.throttled_clients = 0
+        self._lock = threading.Lock()
+
+    def check(self, username: Optional[str], client: Optional[str]) -> None:
+        """Count a login attempt, raises `RateLimited` when throttled."""
+        if client is not None:
+            retry_after = self.clients.hit(client)
+            if retry_after is not None:
+                with self._lock:
+                    self.throttled_clients += 1
+                raise RateLimited(retry_after)
+
+        if username is not None:
+            retry_after = self.usernames.hit(username.lower())
+            if retry_after is not None:
+                with self._lock:
+                    self.throttled_usernames += 1
+                raise RateLimited(retry_after)
+
+        with self._lock:
+            self.allowed += 1
+
+    def succeeded(self, username: str) -> None:
+        """A right password clears the attempts against that username."""
+        self.usernames.reset(username.lower())
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            'allowed': self.allowed,
+            'throttled_usernames': self.throttled_usernames,
+            'throttled_clients': self.throttled_clients,
+            'tracked_usernames': len(self.usernames),
+            'tracked_clients': len(self.clients),
+        }
+
+
+_login_limiter: Optional[LoginRateLimiter] = None
+_login_limiter_lock = threading.Lock()
+
+
+def get_login_limiter() -> LoginRateLimiter:
+    """One limiter for the whole process, shared by every flet session."""
+    global _login_limiter
+    with _login_limiter_lock:
+        if _login_limiter is None:
+            _login_limiter = LoginRateLimiter()
+        return _login_limiter
@@ -0,0 +1,141 @@
+"""
+Password hashing for our model layer.
+
+Hashing and verifying are slow on purpose, so they run on a bounded pool
+of worker threads (scrypt releases the GIL): at most that many of them run
+at once. `hash` and `verify` still keep their caller waiting, only the
+async flavours free it (the event loop) meanwhile.
+"""
+# python
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# local
+from src.utils import constants
+
+SCHEME = 'scrypt'
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        n: int = constants.PASSWORD_HASH_N,
+        r: int = constants.PASSWORD_HASH_R,
+        p: int = constants.PASSWORD_HASH_P,
+        max_workers: int = constants.PASSWORD_HASH_WORKERS,
+    ) -> None:
+        """This class will hash and verify passwords with scrypt."""
+        self.n = n
+        self.r = r
+        self.p = p
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='password-hasher'
+        )
+        # made right away, the first unknown username mustn't pay for it.
+        self._dummy_hash = self.executor.submit(
+            self._hash, secrets.token_urlsafe(16)
+        )
+
+    def _derive(self, password: str, salt: bytes, n: int, r: int, p: int):
+        return hashlib.scrypt(
+            password.encode(),
+            salt=salt,
+            n=n,
+            r=r,
+            p=p,
+            maxmem=256 * n * r * p,
+        )
+
+    def _hash(self, password: str) -> str:
+        salt = os.urandom(16)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return '$'.join(
+            [
+                SCHEME,
+                str(self.n),
+                str(self.r),
+                str(self.p),
+                base64.b64encode(salt).decode(),
+                base64.b64encode(key).decode(),
+            ]
+        )
+
+    def _verify(self, password: str, encoded: str) -> bool:
+        if not self.is_hashed(encoded):
+            # a row from before hashing, the password is stored as is.
+            return hmac.compare_digest(password.encode(), encoded.encode())
+
+        _, n, r, p, salt, key = encoded.split('$')
+        candidate = self._derive(
+            password, base64.b64decode(salt), int(n), int(r), int(p)
+        )
+        return hmac.compare_digest(candidate, base64.b64decode(key))
+
+    def is_hashed(self, encoded: str) -> bool:
+        return encoded.startswith(f'{SCHEME}$') and encoded.count('$') == 5
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """Plaintext rows and hashes made with other costs are upgraded."""
+        if not self.is_hashed(encoded):
+            return True
+
+        _, n, r, p, _, _ = encoded.split('$')
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+    def hash(self, password: str) -> str:
+        """
+        Hash on the pool, the calling thread waits for it all the same:
+        the pool bounds the hashes running at once, it doesn't free us.
+        """
+        return self.executor.submit(self._hash, password).result()
+
+    def verify(self, password: str, encoded: str) -> bool:
+        """Verify on the pool, waiting for it too (see `hash`)."""
+        return self.executor.submit(self._verify, password, encoded).result()
+
+    def dummy_hash(self) -> str:
+        """A hash of nobody's password, with our costs."""
+        return self._dummy_hash.result()
+
+    def verify_unknown(self, password: str) -> bool:
+        """
+        Spend what a verify costs on an username that doesn't exist,
+        answering sooner would tell which ones do. always False.
+        """
+        self.verify(password, self.dummy_hash())
+        return False
+
+    async def hash_async(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._hash, password)
+
+    async def verify_async(self, password: str, encoded: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self._verify, password, encoded
+        )
+
+    async def verify_unknown_async(self, password: str) -> bool:
+        dummy_hash = await asyncio.wrap_future(self._dummy_hash)
+        await self.verify_async(password, dummy_hash)
+        return False
+
+
+_password_hasher: Optional[PasswordHasher] = None
+_password_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """One worker pool for the whole process, shared by every database."""
+    global _password_hasher
+    with _password_hasher_lock:
+        if _password_hasher is None:
+            _password_hasher = PasswordHasher()
+        return _password_hasher
@@ -0,0 +1,145 @@
+"""
+Tenant routing: every tenant (an user, in `user` mode) gets its own sqlite
+file, so write contention and file size grow with the tenant, not with the
+whole deployment. in `single` mode everybody shares `constants.DB_URL`.
+"""
+# python
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# 3rd
+from slugify import slugify
+
+# local
+from src.core.model import DataBase, get_database
+from src.utils import constants
+
+DEFAULT_TENANT = 'default'
+
+
+class TenantRouter:
+    def __init__(
+        self,
+        mode: str = constants.TENANCY,
+        directory: Path = constants.TENANTS_DIR,
+        max_open: int = constants.TENANT_MAX_OPEN,
+        idle_timeout: float = constants.TENANT_IDLE_TIMEOUT,
+    ) -> None:
+        """
+        This class will resolve the database of a tenant, keeping at most
+        `max_open` of them open (least recently used first out), and closing
+        the ones idle for `idle_timeout` seconds.
+        """
+        self.mode = mode
+        self.directory = Path(directory)
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self.closed = 0
+        self._databases: 'OrderedDict[str, Tuple[DataBase, float]]' = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def tenant_for(self, username: Optional[str]) -> str:
+        if self.mode == 'single' or username is None:
+            return DEFAULT_TENANT
+
+        tenant = slugify(username)
+        if not tenant:
+            tenant = hashlib.sha1(username.encode()).hexdigest()
+        return tenant
+
+    def path_for(self, tenant: str) -> Path:
+        return self.directory / f'{slugify(tenant)}.sqlite3'
+
+    def database(
+        self, tenant: Optional[str], create: bool = False
+    ) -> Optional[DataBase]:
+        """
+        The database of `tenant`, `None` if it doesn't exist yet and
+        `create` is not set (so a login never creates empty files).
+        """
+        if self.mode == 'single' or tenant in (None, DEFAULT_TENANT):
+            return get_database(constants.DB_URL)
+
+        now = time.monotonic()
+        with self._lock:
+            self._close_idle(now)
+            if tenant in self._databases:
+                database, _ = self._databases.pop(tenant)
+                self._databases[tenant] = (database, now)
+                return database
+
+            path = self.path_for(tenant)
+            if not path.exists() and not create:
+                return None
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            database = DataBase(
+                path,
+                profile=constants.DB_ENGINE_PROFILES[
+                    constants.TENANT_ENGINE_PROFILE
+                ],
+                default_user=(
+                    tenant == self.tenant_for(constants.DEFAULT_USERNAME)
+                ),
+            )
+            self._databases[tenant] = (database, now)
+            self.opened += 1
+            while len(self._databases) > self.max_open:
+                _, (oldest, _) = self._databases.popitem(last=False)
+                self._close(oldest)
+            return database
+
+    def _close_idle(self, now: float) -> None:
+        for tenant, (database, last_used) in list(self._databases.items()):
+            if now - last_used < self.idle_timeout:
+                # the rest were used even more recently.
+                break
+            del self._databases[tenant]
+            self._close(database)
+
+    def _close(self, database: DataBase) -> None:
+        # a handler still holding it can keep going, the engine reconnects.
+        database.close()
+        self.closed += 1
+
+    def close(self) -> None:
+        with self._lock:
+            while self._databases:
+                _, (database, _) = self._databases.popitem()
+                self._close(database)
+
+    def open_databases(self) -> Dict[str, DataBase]:
+        """The databases open right now, by tenant."""
+        databases = {DEFAULT_TENANT: get_database(constants.DB_URL)}
+        with self._lock:
+            for tenant, (database, _) in self._databases.items():
+                databases[tenant] = database
+        return databases
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'open': len(self._databases),
+                'opened': self.opened,
+                'closed': self.closed,
+            }
+
+
+_tenant_router: Optional[TenantRouter] = None
+_tenant_router_lock = threading.Lock()
+
+
+def get_tenant_router() -> TenantRouter:
+    """One router for the whole process, shared by every flet session."""
+    global _tenant_router
+    with _tenant_router_lock:
+        if _tenant_router is None:
+            _tenant_router = TenantRouter()
+        return _tenant_router
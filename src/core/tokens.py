@@ -0,0 +1,122 @@
+"""
+Session tokens, so a reconnecting flet client skips the login form.
+
+A token is `<key>.<signature>`: forged tokens are rejected by the signature
+alone, valid ones are resolved by an in-memory cache backed by the
+`session` table (which only stores a digest of the key).
+"""
+# python
+import hashlib
+import hmac
+import os
+import secrets
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+# local
+from src.core.cache import LRUCache
+from src.utils import constants
+
+if TYPE_CHECKING:
+    from src.core.model import DataBase, User
+
+
+def load_secret() -> bytes:
+    """The signing secret, generated once and kept next to our database."""
+    if constants.SESSION_SECRET:
+        return constants.SESSION_SECRET.encode()
+
+    path = Path(constants.SESSION_SECRET_FILE)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside (readable by us only) and linked in place, which
+        # fails if it exists: two processes starting at once agree on the
+        # first secret, and nobody reads half of it.
+        fd, temporary = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(secrets.token_urlsafe(32))
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temporary)
+    return path.read_text().strip().encode()
+
+
+class SessionTokens:
+    def __init__(
+        self,
+        database: 'DataBase',
+        secret: Optional[bytes] = None,
+        ttl: float = constants.SESSION_TOKEN_TTL,
+        cache_size: int = constants.SESSION_CACHE_SIZE,
+        cache_ttl: float = constants.SESSION_CACHE_TTL,
+    ) -> None:
+        """This class will issue, resolve and revoke session tokens."""
+        self.database = database
+        self.secret = secret or load_secret()
+        self.ttl = ttl
+        self.cache = LRUCache(cache_size, cache_ttl)
+
+    def sign(self, key: str) -> str:
+        return hmac.new(self.secret, key.encode(), hashlib.sha256).hexdigest()
+
+    def digest(self, key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def split(self, token: Optional[str]) -> Optional[str]:
+        """The key of a well signed token, `None` for anything else."""
+        if not token or token.count('.') != 1:
+            return None
+
+        key, signature = token.split('.')
+        if not hmac.compare_digest(signature, self.sign(key)):
+            return None
+        return key
+
+    def issue(self, user: 'User') -> str:
+        key = secrets.token_urlsafe(32)
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        self.database.delete_expired_auth_sessions(user.id)
+        self.database.insert_auth_session(self.digest(key), user, expires_at)
+        self.cache.set(self.digest(key), (user, expires_at), group=user.id)
+
+        return f'{key}.{self.sign(key)}'
+
+    def resolve(self, token: Optional[str]) -> Optional['User']:
+        """The user of a valid token, from the cache whenever possible."""
+        key = self.split(token)
+        if key is None:
+            return None
+
+        digest = self.digest(key)
+        cached = self.cache.get(digest)
+        if cached is None:
+            cached = self.database.select_auth_session(digest)
+            if cached is None:
+                return None
+            self.cache.set(digest, cached, group=cached[0].id)
+
+        user, expires_at = cached
+        if expires_at <= datetime.utcnow():
+            self.cache.pop(digest)
+            self.database.delete_auth_session(digest)
+            return None
+
+        return user
+
+    def revoke(self, token: Optional[str]) -> None:
+        key = self.split(token)
+        if key is None:
+            return
+
+        digest = self.digest(key)
+        self.cache.pop(digest)
+        self.database.delete_auth_session(digest)
+
+    def forget_user(self, id_user: int) -> None:
+        """Drop the cached tokens of an user, its sessions are gone."""
+        self.cache.invalidate(id_user)
@@ -0,0 +1,148 @@
+"""
+Streaming export and import of users and todos, as NDJSON or CSV.
+
+Rows flow through generators end to end: an export holds one `yield_per`
+batch in memory, an import one chunk, however big the database is.
+
+    <directory>/users.ndjson (or .csv)
+    <directory>/todos.ndjson (or .csv)
+"""
+# python
+import csv
+import json
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, Optional
+
+# local
+from src.core.model import EXPORT_FIELDS, DataBase
+
+FORMATS = ('ndjson', 'csv')
+# users first, the todos point to them.
+KINDS = ('user', 'todo')
+
+# called with the kind and how many of its rows are done so far.
+Progress = Callable[[str, int], Any]
+
+
+def parse_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 't', 'yes')
+
+
+# csv only has text, ndjson keeps the json types.
+CSV_TYPES: Dict[str, Callable[[str], Any]] = {
+    'id': int,
+    'id_user': int,
+    'completed': parse_bool,
+}
+
+
+def path_for(directory: Path, kind: str, format: str) -> Path:
+    return Path(directory) / f'{kind}s.{format}'
+
+
+def write_rows(
+    rows: Iterable[Dict[str, Any]],
+    stream: IO[str],
+    format: str,
+    kind: str,
+    progress: Optional[Progress] = None,
+    every: int = 1000,
+) -> int:
+    """Write `rows` to `stream` one line at a time, returns how many."""
+    if format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS[kind])
+        writer.writeheader()
+        write = writer.writerow
+    elif format == 'ndjson':
+        write = lambda row: stream.write(json.dumps(row) + '\n')
+    else:
+        raise ValueError(f'Unknown format {format!r}, use one of {FORMATS}.')
+
+    count = 0
+    for row in rows:
+        write(row)
+        count += 1
+        if progress is not None and count % every == 0:
+            progress(kind, count)
+
+    if progress is not None:
+        progress(kind, count)
+    return count
+
+
+def read_rows(stream: IO[str], format: str) -> Iterator[Dict[str, Any]]:
+    """The rows of `stream`, one line at a time."""
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            yield {
+                field: (
+                    None if value == '' else CSV_TYPES.get(field, str)(value)
+                )
+                for field, value in row.items()
+            }
+    elif format == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Unknown format {format!r}, use one of {FORMATS}.')
+
+
+def export_database(
+    database: DataBase,
+    directory: Path,
+    format: str = 'ndjson',
+    progress: Optional[Progress] = None,
+) -> Dict[str, int]:
+    """Write every user and todo under `directory`, returns the counts."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    counts = {}
+    for kind in KINDS:
+        path = path_for(directory, kind, format)
+        with path.open('w', newline='', encoding='utf-8') as stream:
+            counts[kind] = write_rows(
+                database.export_rows(kind), stream, format, kind, progress
+            )
+    return counts
+
+
+def import_database(
+    database: DataBase,
+    directory: Path,
+    format: Optional[str] = None,
+    progress: Optional[Progress] = None,
+) -> Dict[str, int]:
+    """
+    Load an export back (see `DataBase.import_rows`), the users already
+    there keep their todos and get the imported ones. the format is
+    guessed from the files found, unless given.
+    """
+    if format is None:
+        format = next(
+            (
+                format
+                for format in FORMATS
+                if path_for(directory, 'user', format).exists()
+            ),
+            FORMATS[0],
+        )
+
+    counts = {}
+    # the ids the users got, the todos follow their owner.
+    user_ids: Dict[int, int] = {}
+    for kind in KINDS:
+        path = path_for(directory, kind, format)
+        with path.open(newline='', encoding='utf-8') as stream:
+            counts[kind] = database.import_rows(
+                kind,
+                read_rows(stream, format),
+                progress=(
+                    None
+                    if progress is None
+                    else lambda count, kind=kind: progress(kind, count)
+                ),
+                user_ids=user_ids,
+            )
+    return counts
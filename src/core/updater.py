@@ -0,0 +1,300 @@
+"""
+Is there a newer release of the app? and its download.
+
+The answer of the releases api is kept on disk with its ETag: for
+UPDATE_CHECK_TTL seconds a launch doesn't touch the network, after that
+the request is conditional and an unchanged release costs a 304.
+
+A download streams into `<dest>.part`, an interrupted one resumes from
+there with a Range request. the ETag of the file is kept next to it and
+sent as If-Range, so a file replaced on the server in between comes back
+whole (200) instead of being spliced onto the old part. a part without
+an ETag can't be told apart from another release's, it starts over. it
+becomes `dest` once complete (and checked against the sha256 of the
+release notes, when they give one).
+"""
+# python
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# 3rd
+import requests
+
+# local
+from src.utils import constants
+
+logger = logging.getLogger(__name__)
+
+# the fields of a release we use, the rest isn't cached.
+RELEASE_FIELDS = ('tag_name', 'name', 'body')
+SHA256 = re.compile(r'sha-?256\W*([0-9a-f]{64})\b', re.IGNORECASE)
+CONTENT_RANGE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+
+# done and total bytes, total is None when the server doesn't tell.
+DownloadProgress = Callable[[int, Optional[int]], None]
+
+
+class UpdateCheckFailed(Exception):
+    pass
+
+
+class DownloadFailed(Exception):
+    pass
+
+
+class UpdateChecker:
+    def __init__(
+        self,
+        url: str = constants.UPDATE_URL,
+        cache_file: Path = constants.UPDATE_CACHE_FILE,
+        ttl: float = constants.UPDATE_CHECK_TTL,
+        timeout: float = constants.UPDATE_CHECK_TIMEOUT,
+    ) -> None:
+        """
+        This class will ask `url` for the latest release, at most once per
+        `ttl` seconds, giving up after `timeout` seconds.
+        """
+        self.url = url
+        self.cache_file = Path(cache_file)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def cached(self) -> Optional[Dict[str, Any]]:
+        try:
+            cache = json.loads(self.cache_file.read_text())
+        except (OSError, ValueError):
+            return None
+        if cache.get('url') != self.url:
+            return None
+        return cache
+
+    def _save(self, release: Dict[str, Any], etag: Optional[str]) -> None:
+        cache = {
+            'url': self.url,
+            'checked_at': time.time(),
+            'etag': etag,
+            'release': release,
+        }
+        # written aside and renamed, a crash never leaves half a file.
+        temporary = self.cache_file.with_name(f'{self.cache_file.name}.tmp')
+        try:
+            temporary.write_text(json.dumps(cache))
+            temporary.replace(self.cache_file)
+        except OSError:
+            logger.warning('Could not cache the update check', exc_info=True)
+
+    def latest_release(self, force: bool = False) -> Dict[str, Any]:
+        """
+        The latest release, from the cache while it is fresh (unless
+        `force`). raises UpdateCheckFailed when the api can't be reached.
+        """
+        with self._lock:
+            cache = self.cached()
+            if (
+                cache is not None
+                and not force
+                and time.time() - cache['checked_at'] < self.ttl
+            ):
+                return cache['release']
+
+            headers = {'Accept': 'application/vnd.github.v3+json'}
+            if cache is not None and cache.get('etag'):
+                headers['If-None-Match'] = cache['etag']
+            try:
+                response = requests.get(
+                    self.url, headers=headers, timeout=self.timeout
+                )
+            except requests.RequestException as error:
+                raise UpdateCheckFailed(str(error)) from error
+
+            if response.status_code == 304 and cache is not None:
+                self._save(cache['release'], cache.get('etag'))
+                return cache['release']
+            if response.status_code != 200:
+                raise UpdateCheckFailed(f'HTTP {response.status_code}')
+
+            try:
+                release_info = response.json()
+                release = {key: release_info[key] for key in RELEASE_FIELDS}
+            except (ValueError, KeyError, TypeError) as error:
+                raise UpdateCheckFailed('Unexpected answer') from error
+            self._save(release, response.headers.get('ETag'))
+            return release
+
+    def check_in_background(
+        self,
+        callback: Callable[
+            [Optional[Dict[str, Any]], Optional[Exception]], None
+        ],
+        force: bool = False,
+    ) -> threading.Thread:
+        """
+        Run `latest_release` in a thread, then `callback(release, error)`
+        (in that thread) with one of the two set.
+        """
+
+        def run() -> None:
+            try:
+                release = self.latest_release(force)
+            except UpdateCheckFailed as error:
+                callback(None, error)
+            else:
+                callback(release, None)
+
+        thread = threading.Thread(target=run, name='update-check', daemon=True)
+        thread.start()
+        return thread
+
+
+_update_checker: Optional[UpdateChecker] = None
+_update_checker_lock = threading.Lock()
+
+
+def get_update_checker() -> UpdateChecker:
+    global _update_checker
+    with _update_checker_lock:
+        if _update_checker is None:
+            _update_checker = UpdateChecker()
+        return _update_checker
+
+
+def release_sha256(release: Dict[str, Any]) -> Optional[str]:
+    """The sha256 given in the notes of `release`, if any."""
+    match = SHA256.search(release.get('body') or '')
+    return match.group(1).lower() if match else None
+
+
+def partial_path(dest: Path) -> Path:
+    return dest.with_name(f'{dest.name}.part')
+
+
+def etag_path(dest: Path) -> Path:
+    return dest.with_name(f'{dest.name}.part.etag')
+
+
+def _saved_etag(dest: Path) -> Optional[str]:
+    try:
+        etag = etag_path(dest).read_text().strip()
+    except OSError:
+        return None
+    return etag if etag and not etag.startswith('W/') else None
+
+
+def _save_etag(dest: Path, etag: Optional[str]) -> None:
+    # If-Range only takes a strong validator, a weak one can't resume.
+    if not etag or etag.startswith('W/'):
+        etag_path(dest).unlink(missing_ok=True)
+        return
+    try:
+        etag_path(dest).write_text(etag)
+    except OSError:
+        logger.warning('Could not save the ETag of %s', dest, exc_info=True)
+
+
+def _discard_partial(dest: Path) -> None:
+    partial_path(dest).unlink(missing_ok=True)
+    etag_path(dest).unlink(missing_ok=True)
+
+
+def download(
+    url: str,
+    dest: Path,
+    sha256: Optional[str] = None,
+    progress: Optional[DownloadProgress] = None,
+    chunk_size: int = constants.DOWNLOAD_CHUNK_SIZE,
+    timeout: float = constants.DOWNLOAD_TIMEOUT,
+    every: float = constants.DOWNLOAD_PROGRESS_INTERVAL,
+) -> Path:
+    """
+    Stream `url` into `dest`, resuming a previous partial download (of
+    the same file, by its ETag). `progress` is called at most every
+    `every` seconds, and once at the end. raises DownloadFailed, the
+    partial file is kept to resume unless it turned out to be wrong.
+    """
+    dest = Path(dest)
+    partial = partial_path(dest)
+    etag = _saved_etag(dest)
+    if etag is None:
+        # nothing tells which file the part is of, it can't be resumed.
+        _discard_partial(dest)
+    digest = hashlib.sha256()
+    done = 0
+    if partial.exists():
+        with open(partial, 'rb') as file:
+            for block in iter(lambda: file.read(chunk_size), b''):
+                digest.update(block)
+                done += len(block)
+
+    last = 0.0
+
+    def report(force: bool = False) -> None:
+        nonlocal last
+        now = time.monotonic()
+        if progress is not None and (force or now - last >= every):
+            last = now
+            progress(done, total)
+
+    headers = {}
+    if done:
+        # the server sends the whole file (200) if it has changed.
+        headers = {'Range': f'bytes={done}-', 'If-Range': etag}
+    try:
+        with requests.get(
+            url, headers=headers, stream=True, timeout=timeout
+        ) as response:
+            content_range = CONTENT_RANGE.match(
+                response.headers.get('Content-Range', '')
+            )
+            if response.status_code == 416:
+                # nothing left after our part: complete, or not ours.
+                total = done
+                if response.headers.get('Content-Range') != f'bytes */{done}':
+                    _discard_partial(dest)
+                    raise DownloadFailed('Could not resume the download')
+            elif response.status_code == 206 and content_range:
+                if int(content_range.group(1)) != done:
+                    raise DownloadFailed('Unexpected range')
+                total = content_range.group(2)
+                total = None if total == '*' else int(total)
+                mode = 'ab'
+            elif response.status_code == 200:
+                # the whole file (no range support, or it changed): start
+                # over, remembering which file this part is of.
+                digest = hashlib.sha256()
+                done = 0
+                length = response.headers.get('Content-Length')
+                total = int(length) if length else None
+                mode = 'wb'
+                _save_etag(dest, response.headers.get('ETag'))
+            else:
+                raise DownloadFailed(f'HTTP {response.status_code}')
+
+            if response.status_code != 416:
+                report(force=True)
+                with open(partial, mode) as file:
+                    for chunk in response.iter_content(chunk_size):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        done += len(chunk)
+                        report()
+    except requests.RequestException as error:
+        raise DownloadFailed(str(error)) from error
+
+    if total is not None and done != total:
+        raise DownloadFailed(f'Incomplete download ({done}/{total} bytes)')
+    if sha256 is not None and digest.hexdigest() != sha256.lower():
+        _discard_partial(dest)
+        raise DownloadFailed('Checksum mismatch')
+
+    os.replace(partial, dest)
+    etag_path(dest).unlink(missing_ok=True)
+    report(force=True)
+    return dest
@@ -0,0 +1,138 @@
+"""
+Write-behind for todo mutations.
+
+The ui gets its answer right away, the writes wait in memory and are
+flushed together, in a single commit, every few milliseconds or as soon as
+enough of them are queued.
+"""
+# python
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable
+
+# local
+from src.utils import constants
+
+if TYPE_CHECKING:
+    from src.core.model import DataBase
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        database: 'DataBase',
+        interval: float = constants.WRITE_BEHIND_INTERVAL_MS / 1000,
+        max_ops: int = constants.WRITE_BEHIND_MAX_OPS,
+    ) -> None:
+        """This class will queue database writes and group commit them."""
+        self.database = database
+        self.interval = interval
+        self.max_ops = max_ops
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.failed_ops = 0
+
+        # a later write of the same key (the same todo toggled again and
+        # again) replaces the queued one.
+        self._pending: 'OrderedDict[Hashable, Callable[[], Any]]' = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._applying = threading.local()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name='write-behind', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def defer(self, key: Hashable, write: Callable[[], Any]) -> bool:
+        """
+        Queue `write`, returns False when it must run right now instead:
+        the queue is closed, or we are the flush replaying it.
+        """
+        if self._closed or getattr(self._applying, 'active', False):
+            return False
+
+        with self._lock:
+            self._pending[key] = write
+            full = len(self._pending) >= self.max_ops
+        if full:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Apply every queued write in one unit of work."""
+        with self._flush_lock:
+            with self._lock:
+                writes = list(self._pending.values())
+                self._pending.clear()
+            if not writes:
+                return 0
+
+            self._applying.active = True
+            try:
+                self._apply(writes)
+            finally:
+                self._applying.active = False
+
+            self.flushes += 1
+            return len(writes)
+
+    def _apply(self, writes: list) -> None:
+        try:
+            with self.database.session_scope():
+                for write in writes:
+                    write()
+            self.flushed_ops += len(writes)
+            return
+        except Exception:
+            logger.exception('Group commit failed, retrying writes one by one')
+
+        # the whole group was rolled back, don't let a bad write take the
+        # good ones with it.
+        for write in writes:
+            try:
+                with self.database.session_scope():
+                    write()
+                self.flushed_ops += 1
+            except Exception:
+                self.failed_ops += 1
+                logger.exception('Queued write failed')
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed')
+
+    def close(self) -> None:
+        """Stop the flusher and write what is still queued."""
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'flushed_ops': self.flushed_ops,
+            'failed_ops': self.failed_ops,
+        }
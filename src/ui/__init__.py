@@ -2,6 +2,7 @@ from .about import __VERSION__, About
 from .accounts import Accounts
 from .app_layout import UserInterface
 from .application import Application
+from .diagnostics import Diagnostics
 from .discord import Discord
 from .home import Home
 from .responsive_menu_layout import ResponsiveMenuLayout
@@ -1,30 +1,75 @@
 import json
+import threading
+import time
 import webbrowser
+from bisect import bisect
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Dict, List, Optional
 
 import flet as ft
-import requests
 from flet import theme
 
-from src.core import MOBILE_USER_AGENT, PC_USER_AGENT
+from src.core import MOBILE_USER_AGENT, PC_USER_AGENT, updater
+from src.core.batching import batched, batched_updates
 from src.core.other_functions import resource_path
+from src.core.updater import get_update_checker
 from src.utils import constants
 
 from .about import __VERSION__, About
 from .accounts import Accounts
+from .diagnostics import Diagnostics
 from .discord import Discord
 from .home import Home
-from .responsive_menu_layout import ResponsiveMenuLayout
-from .settings import Settings
+from .responsive_menu_layout import MENU_BREAKPOINT, ResponsiveMenuLayout
+from .settings import COMPACT_WIDTH, Settings
 from .telegram import Telegram
 
 LIGHT_SEED_COLOR = ft.colors.TEAL
 DARK_SEED_COLOR = ft.colors.INDIGO
 
+# the pages of the menu, in order: name, class, navigation item. a page is
+# built the first time it is shown or used (`UserInterface.<name>_page`).
+PAGES = [
+    ('home', Home, dict(icon=ft.icons.HOME, label='Farmer')),
+    ('accounts', Accounts, dict(icon=ft.icons.PEOPLE_ALT, label='Accounts')),
+    ('telegram', Telegram, dict(icon=ft.icons.TELEGRAM, label='Telegram')),
+    ('discord', Discord, dict(icon=ft.icons.DISCORD, label='Discord')),
+    ('settings', Settings, dict(icon=ft.icons.SETTINGS, label='Settings')),
+    (
+        'diagnostics',
+        Diagnostics,
+        dict(icon=ft.icons.QUERY_STATS, label='Diagnostics'),
+    ),
+    ('about', About, dict(icon=ft.icons.INFO_ROUNDED, label='About')),
+]
+PAGE_NAMES = [name for name, _, _ in PAGES]
+# the widths where a page changes its layout.
+WIDTH_BREAKPOINTS = sorted((COMPACT_WIDTH, MENU_BREAKPOINT))
+
+
+class LazyPage:
+    """`UserInterface.<name>_page`, the page built on first access."""
+
+    def __set_name__(self, owner, attribute: str):
+        self.name = attribute[: -len('_page')]
+
+    def __get__(self, user_interface, owner=None):
+        if user_interface is None:
+            return self
+        return user_interface.get_page(self.name)
+
 
 class UserInterface(ft.View):
+    home_page = LazyPage()
+    accounts_page = LazyPage()
+    telegram_page = LazyPage()
+    discord_page = LazyPage()
+    settings_page = LazyPage()
+    diagnostics_page = LazyPage()
+    about_page = LazyPage()
+
     def __init__(self, page: ft.Page):
         super().__init__()
         self.page = page
@@ -54,14 +99,22 @@ class UserInterface(ft.View):
         self.page.window_width = 1280
         self.page.window_min_height = 795
         self.page.window_min_width = 765
-        self.page.on_resize = self.on_page_resize
         self.page.window_center()
         self.page.on_route_change = self.on_route_change
         self.page.on_error = self.save_app_error
         self.is_farmer_running: bool = False
         self.is_checking_update: bool = False
+        self._resize_lock = threading.Lock()
+        self._resize_thread: Optional[threading.Thread] = None
+        self._resize_deadline = 0.0
+        self._resize_event: Optional[ft.ControlEvent] = None
+        self._width_bucket: Optional[int] = None
+        # the logged in user, see `set_user`.
+        self.username: Optional[str] = None
 
         self.ui()
+        # after the menu layout, which sets its own handler.
+        self.page.on_resize = self.on_page_resize
         self.page.update()
         self.auto_start_if_needed()
         self.check_for_update(None, True)
@@ -96,6 +149,25 @@ class UserInterface(ft.View):
             )
         )
 
+        # the handler exports into (imports from) the directory picked.
+        self.export_picker = ft.FilePicker()
+        self.import_picker = ft.FilePicker()
+        self.page.overlay.extend([self.export_picker, self.import_picker])
+        self.export_button = ft.PopupMenuItem(
+            icon=ft.icons.UPLOAD_FILE,
+            text='Export data',
+            on_click=lambda _: self.export_picker.get_directory_path(
+                'Export to'
+            ),
+        )
+        self.import_button = ft.PopupMenuItem(
+            icon=ft.icons.DOWNLOAD,
+            text='Import data',
+            on_click=lambda _: self.import_picker.get_directory_path(
+                'Import from'
+            ),
+        )
+
         self.update_dialog = ft.AlertDialog(
             actions_alignment='center', modal=True, actions=[]
         )
@@ -117,6 +189,9 @@ class UserInterface(ft.View):
                             on_click=self.reset_all_settings,
                         ),
                         ft.PopupMenuItem(),
+                        self.export_button,
+                        self.import_button,
+                        ft.PopupMenuItem(),
                         self.logout_button,
                     ]
                 ),
@@ -124,14 +199,15 @@ class UserInterface(ft.View):
         )
 
         # Exit dialog confirmation
+        self.exit_button = ft.ElevatedButton(
+            'Yes', on_click=lambda _: self.page.window_destroy()
+        )
         self.exit_dialog = ft.AlertDialog(
             modal=False,
             title=ft.Text('Exit confirmation'),
             content=ft.Text('Do you really want to exit?'),
             actions=[
-                ft.ElevatedButton(
-                    'Yes', on_click=lambda _: self.page.window_destroy()
-                ),
+                self.exit_button,
                 ft.OutlinedButton('No', on_click=self.no_click),
             ],
             actions_alignment='end',
@@ -152,71 +228,52 @@ class UserInterface(ft.View):
             content=self.snack_bar_message, bgcolor=self.color_scheme
         )
 
-        self.home_page = Home(self, self.page)
-        self.settings_page = Settings(self, self.page)
-        self.telegram_page = Telegram(self, self.page)
-        self.discord_page = Discord(self, self.page)
-        self.accounts_page = Accounts(self, self.page)
-        self.about_page = About(self, self.page)
-
-        pages = [
-            (
-                dict(
-                    icon=ft.icons.HOME,
-                    selected_icon=ft.icons.HOME,
-                    label='Farmer',
-                ),
-                self.home_page.build(),
-            ),
-            (
-                dict(
-                    icon=ft.icons.PEOPLE_ALT,
-                    selected_icon=ft.icons.PEOPLE_ALT,
-                    label='Accounts',
-                ),
-                self.accounts_page.build(),
-            ),
-            (
-                dict(
-                    icon=ft.icons.TELEGRAM,
-                    selected_icon=ft.icons.TELEGRAM,
-                    label='Telegram',
-                ),
-                self.telegram_page.build(),
-            ),
-            (
-                dict(
-                    icon=ft.icons.DISCORD,
-                    selected_icon=ft.icons.DISCORD,
-                    label='Discord',
-                ),
-                self.discord_page.build(),
-            ),
-            (
-                dict(
-                    icon=ft.icons.SETTINGS,
-                    selected_icon=ft.icons.SETTINGS,
-                    label='Settings',
-                ),
-                self.settings_page.build(),
-            ),
-            (
-                dict(
-                    icon=ft.icons.INFO_ROUNDED,
-                    selected_icon=ft.icons.INFO_ROUNDED,
-                    label='About',
-                ),
-                self.about_page.build(),
-            ),
-        ]
-
+        self._pages: Dict[str, ft.UserControl] = {}
         self.menu_layout = ResponsiveMenuLayout(
-            self.page, pages, landscape_minimize_to_icons=True
+            self.page,
+            [
+                (
+                    dict(navigation, selected_icon=navigation['icon']),
+                    partial(self.build_page, name),
+                )
+                for name, _, navigation in PAGES
+            ],
+            landscape_minimize_to_icons=True,
+            on_page_change=self.on_page_change,
         )
         menu_button.on_click = lambda e: self.menu_layout.toggle_navigation()
         # self.page.add(self.menu_layout)
         self.controls.append(self.menu_layout)
         self.page.update()
+        if constants.PREFETCH_PAGES:
+            self.menu_layout.prefetch(constants.PREFETCH_DELAY)
+
+    def build_page(self, name: str) -> ft.Control:
+        page_class = PAGES[PAGE_NAMES.index(name)][1]
+        with batched_updates(self.page):
+            self._pages[name] = page_class(self, self.page)
+        return self._pages[name].build()
+
+    def get_page(self, name: str) -> ft.UserControl:
+        """The page `name`, built and mounted if it was not yet."""
+        self.menu_layout.page_content(PAGE_NAMES.index(name))
+        return self._pages[name]
+
+    def built_page(self, name: str) -> Optional[ft.UserControl]:
+        """The page `name` if it was built already, else None."""
+        return self._pages.get(name)
+
+    def set_user(self, username: Optional[str]) -> None:
+        self.username = username
+        # what the diagnostics page shows depends on who is asking.
+        diagnostics = self.built_page('diagnostics')
+        if diagnostics is not None:
+            diagnostics.set_content()
+
+    def on_page_change(self, route: str):
+        # the accounts page owns the add account button.
+        if self.page.floating_action_button is not None:
+            self.page.floating_action_button.visible = route == '/accounts'
 
     def window_event(self, e):
         if e.data == 'close':
@@ -228,6 +285,7 @@ class UserInterface(ft.View):
         self.exit_dialog.open = False
         self.page.update()
 
+    @batched
     def toggle_theme_mode(self, e):
         self.page.theme_mode = (
             'dark' if self.page.theme_mode == 'light' else 'light'
@@ -245,11 +303,11 @@ class UserInterface(ft.View):
     def change_color_scheme(self):
         self.color_scheme = self.get_color_scheme()
         self.page.snack_bar.bgcolor = self.color_scheme
-        self.home_page.toggle_theme_mode(self.color_scheme)
-        self.settings_page.toggle_theme_mode(self.color_scheme)
-        self.telegram_page.toggle_theme_mode(self.color_scheme)
-        self.discord_page.toggle_theme_mode(self.color_scheme)
-        self.accounts_page.toggle_theme_mode(self.color_scheme)
+        # the pages not built yet take the color scheme when they are.
+        for name in ('home', 'settings', 'telegram', 'discord', 'accounts'):
+            page = self.built_page(name)
+            if page is not None:
+                page.toggle_theme_mode(self.color_scheme)
         self.page.update()
 
     def first_time_setup(self):
@@ -348,10 +406,7 @@ class UserInterface(ft.View):
             return self.page.client_storage.get('MRFarmer.dark_widgets_color')
 
     def on_route_change(self, e):
-        if e.data == '/accounts':
-            self.page.floating_action_button.visible = True
-        else:
-            self.page.floating_action_button.visible = False
+        self.on_page_change(e.data)
         self.page.update()
 
     def display_error(self, title: str, description: str):
@@ -417,48 +472,118 @@ class UserInterface(ft.View):
             self.page.update()
 
     def on_page_resize(self, e: ft.ControlEvent):
+        """
+        Dragging a window edge sends a flood of these, only the last one is
+        handled, once the size held for RESIZE_DEBOUNCE seconds. one thread
+        waits for the whole flood, the events only push its deadline.
+        """
+        with self._resize_lock:
+            self._resize_event = e
+            self._resize_deadline = (
+                time.monotonic() + constants.RESIZE_DEBOUNCE
+            )
+            if self._resize_thread is not None:
+                return
+            self._resize_thread = threading.Thread(
+                target=self.wait_resize, name='resize', daemon=True
+            )
+            self._resize_thread.start()
+
+    def wait_resize(self):
+        while True:
+            with self._resize_lock:
+                delay = self._resize_deadline - time.monotonic()
+                if delay <= 0:
+                    self._resize_thread = None
+                    break
+            time.sleep(delay)
+        self.apply_resize()
+
+    @batched
+    def apply_resize(self):
+        self.menu_layout.handle_resize(self._resize_event)
         try:
-            self.menu_layout.handle_resize(e)
-            self.accounts_page.accounts_container.refresh()
-            width = float(e.data.split(',')[0])
-            if width < 1140:
-                self.settings_page.msn_shopping_game_switch.label = 'MSN'
-                self.page.update()
-            elif (
-                width >= 1140
-                and self.settings_page.msn_shopping_game_switch.label == 'MSN'
-            ):
-                self.settings_page.msn_shopping_game_switch.label = (
-                    'MSN shopping Game'
-                )
-                self.page.update()
-        except AttributeError:
-            pass
+            width = float(self._resize_event.data.split(',')[0])
+        except (AttributeError, ValueError):
+            return
+        # the pages only change at the breakpoints, nothing to do between.
+        width_bucket = bisect(WIDTH_BREAKPOINTS, width)
+        if width_bucket == self._width_bucket:
+            return
+        self._width_bucket = width_bucket
+
+        accounts_page = self.built_page('accounts')
+        if accounts_page is not None:
+            accounts_page.accounts_container.refresh()
+        settings_page = self.built_page('settings')
+        if settings_page is not None:
+            settings_page.msn_shopping_game_switch.label = (
+                'MSN' if width < COMPACT_WIDTH else 'MSN shopping game'
+            )
+        self.page.update()
 
     def check_for_update(self, e: ft.ControlEvent, on_start: bool = False):
+        """
+        Ask for the latest release in the background, the dialog shows up
+        when the answer comes. at start the cached answer is good enough.
+        """
+        if self.is_checking_update:
+            return
+        self.is_checking_update = True
+        self.check_update_button.disabled = True
+        self.update_progress_ring.visible = True
+        self.update_icon.visible = False
+        self.page.update()
+        get_update_checker().check_in_background(
+            lambda release, error: self.update_checked(
+                release, error, on_start
+            ),
+            force=not on_start,
+        )
+
+    @batched
+    def update_checked(
+        self,
+        release_info: Optional[dict],
+        error: Optional[Exception],
+        on_start: bool = False,
+    ):
         def download(tag_name: str):
             download_btn.disabled = True
             close_btn.disabled = True
+            progress_text = ft.Text('Downloading...')
+            progress_bar = ft.ProgressBar(width=300, color=self.color_scheme)
             self.update_dialog.content = ft.Column(
-                [
-                    ft.Text('Downloading...'),
-                    ft.ProgressBar(width=300, color=self.color_scheme),
-                ],
-                height=50,
+                [progress_text, progress_bar], height=50
             )
             self.page.update()
-            download_url = f'https://github.com/farshadz1997/Microsoft-Rewards-bot-GUI-V2/archive/refs/tags/{tag_name}.zip'
-            try:
-                response = requests.get(download_url)
-                if response.status_code == 200:
-                    with open(
+
+            def show_progress(done: int, total: Optional[int]):
+                if total:
+                    progress_bar.value = done / total
+                    progress_text.value = (
+                        f'Downloading... {done / 2**20:.1f} of '
+                        f'{total / 2**20:.1f} MB'
+                    )
+                else:
+                    progress_text.value = (
+                        f'Downloading... {done / 2**20:.1f} MB'
+                    )
+                self.page.update()
+
+            def run():
+                try:
+                    updater.download(
+                        constants.UPDATE_DOWNLOAD_URL.format(
+                            tag_name=tag_name
+                        ),
                         resource_path(
                             f"Microsoft-Rewards-bot-GUI-V2_{release_info['name']}.zip",
                             True,
                         ),
-                        'wb',
-                    ) as f:
-                        f.write(response.content)
+                        sha256=updater.release_sha256(release_info),
+                        progress=show_progress,
+                    )
                     self.update_dialog.content = ft.Column(
                         [
                             ft.Text('Download completed'),
@@ -468,86 +593,71 @@ class UserInterface(ft.View):
                         ],
                         height=50,
                     )
+                except (updater.DownloadFailed, OSError):
+                    self.update_dialog.content = ft.Column(
+                        [
+                            ft.Text('Download failed, try again to resume'),
+                            ft.ProgressBar(width=300, color='red', value=100),
+                        ],
+                        height=50,
+                    )
+                finally:
                     download_btn.disabled = False
                     close_btn.disabled = False
                     self.page.update()
-                else:
-                    raise Exception
-            except:
-                self.update_dialog.content = ft.Column(
-                    [
-                        ft.Text('Download failed'),
-                        ft.ProgressBar(width=300, color='red', value=100),
-                    ],
-                    height=50,
-                )
-                download_btn.disabled = False
-                close_btn.disabled = False
-                self.page.update()
 
-        if self.is_checking_update:
-            return
-        self.is_checking_update = True
-        self.check_update_button.disabled = True
-        self.update_progress_ring.visible = True
-        self.update_icon.visible = False
-        self.page.update()
-        headers = {'Accept': 'application/vnd.github.v3+json'}
-        url = 'https://api.github.com/repos/farshadz1997/Microsoft-Rewards-bot-GUI-V2/releases/latest'
+            # the download runs in its own thread, the ui stays responsive.
+            threading.Thread(target=run, name='download', daemon=True).start()
+
         try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                release_info = json.loads(response.text)
-                latest_version = release_info['tag_name']
+            if error is not None:
+                if not on_start:
+                    self.display_error(
+                        'Update check failed', 'Could not check for update'
+                    )
+                return
+            latest_version = release_info['tag_name']
+            if float(latest_version) > __VERSION__:
+                self.update_dialog.actions.clear()
+                self.update_dialog.title = ft.Text('New version available!')
+                self.update_dialog.content = ft.Markdown(
+                    release_info['body'],
+                    on_tap_link=lambda e: webbrowser.open(e.data),
+                )
+                download_btn = ft.ElevatedButton(
+                    text='Download',
+                    on_click=lambda _: download(latest_version),
+                )
+                self.update_dialog.actions.append(download_btn)
+                close_btn = ft.ElevatedButton(
+                    text='Close',
+                    on_click=lambda e: self.close_error(e, self.update_dialog),
+                )
+                self.update_dialog.actions.append(close_btn)
                 self.page.dialog = self.update_dialog
-                if float(latest_version) > __VERSION__:
+                self.update_dialog.open = True
+                self.page.update()
+            else:
+                if not on_start:
                     self.update_dialog.actions.clear()
                     self.update_dialog.title = ft.Text(
-                        'New version available!'
-                    )
-                    self.update_dialog.content = ft.Markdown(
-                        release_info['body'],
-                        on_tap_link=lambda e: webbrowser.open(e.data),
+                        'No new version available'
                     )
-                    download_btn = ft.ElevatedButton(
-                        text='Download',
-                        on_click=lambda _: download(latest_version),
+                    self.update_dialog.content = ft.Text(
+                        'You are using the latest version of the app'
                     )
-                    self.update_dialog.actions.append(download_btn)
-                    close_btn = ft.ElevatedButton(
-                        text='Close',
-                        on_click=lambda e: self.close_error(
-                            e, self.update_dialog
+                    self.update_dialog.actions.append(
+                        ft.ElevatedButton(
+                            text='Ok',
+                            on_click=lambda e: self.close_error(
+                                e, self.update_dialog
+                            ),
                         ),
                     )
-                    self.update_dialog.actions.append(close_btn)
+                    self.page.dialog = self.update_dialog
                     self.update_dialog.open = True
                     self.page.update()
-                else:
-                    if not on_start:
-                        self.update_dialog.actions.clear()
-                        self.update_dialog.title = ft.Text(
-                            'No new version available'
-                        )
-                        self.update_dialog.content = ft.Text(
-                            'You are using the latest version of the app'
-                        )
-                        self.update_dialog.actions.append(
-                            ft.ElevatedButton(
-                                text='Ok',
-                                on_click=lambda e: self.close_error(
-                                    e, self.update_dialog
-                                ),
-                            ),
-                        )
-                        self.page.dialog.open = True
-                        self.page.update()
-            else:
-                if not on_start:
-                    self.display_error(
-                        'Update check failed', 'Could not check for update'
-                    )
-        except:
+        except ValueError:
             if not on_start:
                 self.display_error(
                     'Update check failed', 'Could not check for update'
@@ -559,6 +669,7 @@ class UserInterface(ft.View):
             self.is_checking_update = False
             self.page.update()
 
+    @batched
     def reset_all_settings(self, e: ft.ControlEvent):
         if self.is_farmer_running:
             self.display_error(
@@ -568,8 +679,9 @@ class UserInterface(ft.View):
         self.page.client_storage.clear()
         self.page.session.clear()
         self.first_time_setup()
-        self.home_page.set_initial_values()
-        self.telegram_page.set_initial_values()
-        self.settings_page.set_initial_values()
+        for name in ('home', 'telegram', 'settings'):
+            page = self.built_page(name)
+            if page is not None:
+                page.set_initial_values()
         self.toggle_theme_mode(None)
         self.page.update()
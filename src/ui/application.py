@@ -5,11 +5,14 @@ from typing import Dict, List, Optional
 
 import flet as ft
 
-from src.core.handler import Handler
+from src.core.batching import batched_updates
+from src.core.handler import AsyncHandler, Handler
 from src.core.model import Todo
 from src.ui import UserInterface
 from src.utils import constants
 
+SESSION_TOKEN_KEY = 'MRFarmer.session_token'
+
 
 class ApplicationAppBar(ft.AppBar):
     def __init__(self) -> None:
@@ -130,22 +133,29 @@ class RegisterView(LoginView):
 class Application:
     def __init__(self, page: ft.Page) -> None:
         """This class will grab all others widgets."""
-        # 1), first we create all the widgets.
+        # 1), first we create all the widgets. the page is sent to the
+        # client once, when everything is in place.
         self.page = page
-        self.page.title = 'Flet-Alchemy'
-        self.user_interface = UserInterface(self.page)
-        self.login_view = LoginView()
-        self.register_view = RegisterView()
-
-        # 2) now, after widgets created, we can configure their events.
-        # and start the database.
-        self.handler = Handler(self)
-
-        # 3) setting the initial state.
-        self.show_login_view()
-        self.set_login_form(
-            constants.DEFAULT_USERNAME, constants.DEFAULT_PASSWORD
-        )
+        with batched_updates(self.page):
+            self.page.title = 'Flet-Alchemy'
+            self.user_interface = UserInterface(self.page)
+            self.login_view = LoginView()
+            self.register_view = RegisterView()
+
+            # 2) now, after widgets created, we can configure their events.
+            # and start the database.
+            if constants.ASYNC_HANDLERS:
+                self.handler = AsyncHandler(self)
+            else:
+                self.handler = Handler(self)
+
+            # 3) setting the initial state, a returning client with a valid
+            # session token skips the login view.
+            if not self.handler.restore_session():
+                self.show_login_view()
+                self.set_login_form(
+                    constants.DEFAULT_USERNAME, constants.DEFAULT_PASSWORD
+                )
 
     def show_login_view(self) -> None:
         self.page.views.clear()
@@ -158,6 +168,8 @@ class Application:
         self.page.update()
 
     def show_user_interface_view(self) -> None:
+        user = self.handler.user
+        self.user_interface.set_user(None if user is None else user.username)
         self.page.views.clear()
         self.page.views.append(self.user_interface)
         self.page.update()
@@ -183,6 +195,15 @@ class Application:
         self.page.snack_bar.open = True
         self.page.update()
 
+    def display_progress(self, message: str) -> None:
+        """long jobs (export, import) keep updating the same snack."""
+        snack = self.page.snack_bar
+        if isinstance(snack, SuccessSnackBar) and snack.open:
+            snack.message.value = message
+            self.page.update()
+        else:
+            self.display_success_snack(message)
+
     def display_warning_banner(self, message: str) -> None:
         self.page.banner = WarningBanner(self.page, message)
         self.page.banner.open = True
@@ -241,6 +262,20 @@ class Application:
         self.register_view.password_field.value = password
         self.page.update()
 
+    def get_session_token(self) -> Optional[str]:
+        return self.page.client_storage.get(SESSION_TOKEN_KEY)
+
+    def set_session_token(self, token: str) -> None:
+        self.page.client_storage.set(SESSION_TOKEN_KEY, token)
+
+    def clear_session_token(self) -> None:
+        if self.page.client_storage.contains_key(SESSION_TOKEN_KEY):
+            self.page.client_storage.remove(SESSION_TOKEN_KEY)
+
+    @property
+    def client_ip(self) -> Optional[str]:
+        return getattr(self.page, 'client_ip', None) or None
+
     @property
     def login_button(self) -> ft.OutlinedButton:
         return self.login_view.login_button
@@ -260,3 +295,18 @@ class Application:
     @property
     def logout_button(self) -> ft.IconButton:
         return self.user_interface.logout_button
+
+    @property
+    def exit_button(self) -> ft.ElevatedButton:
+        return self.user_interface.exit_button
+
+    @property
+    def export_picker(self) -> ft.FilePicker:
+        return self.user_interface.export_picker
+
+    @property
+    def import_picker(self) -> ft.FilePicker:
+        return self.user_interface.import_picker
+
+    def close_window(self) -> None:
+        self.page.window_destroy()
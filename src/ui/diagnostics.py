@@ -0,0 +1,225 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+import flet as ft
+
+from src.core.instrumentation import get_query_stats
+from src.core.ratelimit import get_login_limiter
+from src.core.tenancy import get_tenant_router
+from src.utils import constants
+
+
+def can_see_diagnostics(page: ft.Page, username: Optional[str]) -> bool:
+    """
+    The page shows raw sql and resets the stats of everybody: on the
+    desktop it's ours, on the web only the admin (default user) sees it.
+    """
+    return not page.web or username == constants.DEFAULT_USERNAME
+
+
+def statements_table(snapshot: Dict[str, Any]) -> str:
+    rows = [
+        '| count | total ms | p50 ms | p95 ms | max ms | statement |',
+        '|---:|---:|---:|---:|---:|---|',
+    ]
+    for stats in snapshot['statements']:
+        statement = ' '.join(stats['statement'].split())[:120]
+        rows.append(
+            f'| {stats["count"]} | {stats["total_ms"]} | {stats["p50_ms"]} '
+            f'| {stats["p95_ms"]} | {stats["max_ms"]} | `{statement}` |'
+        )
+    return '\n'.join(rows)
+
+
+def actions_table(snapshot: Dict[str, Any]) -> str:
+    rows = [
+        '| action | runs | queries | per run | max |',
+        '|---|---:|---:|---:|---:|',
+    ]
+    for name, stats in snapshot['actions'].items():
+        rows.append(
+            f'| {name} | {stats["runs"]} | {stats["queries"]} '
+            f'| {stats["queries_per_run"]} | {stats["max_queries"]} |'
+        )
+    return '\n'.join(rows)
+
+
+def counters_table(name: str, counters: Dict[str, Dict[str, Any]]) -> str:
+    """One row per entry of `counters`, one column per counter."""
+    if not counters:
+        return '_None._'
+    columns = list(next(iter(counters.values())))
+    rows = [
+        '| ' + ' | '.join([name, *columns]) + ' |',
+        '|---|' + '---:|' * len(columns),
+    ]
+    for key, values in counters.items():
+        cells = [str(values[column]) for column in columns]
+        rows.append('| ' + ' | '.join([key, *cells]) + ' |')
+    return '\n'.join(rows)
+
+
+def counters_total(counters: Iterable[Dict[str, int]]) -> Dict[str, int]:
+    """The sum of every counter, per name."""
+    total: Counter = Counter()
+    for values in counters:
+        total.update(values)
+    return dict(total)
+
+
+def queries_list(entries: list, value: str, unit: str) -> str:
+    if not entries:
+        return '_None._'
+    return '\n'.join(
+        f'- **{entry["action"]}** {entry[value]}{unit}: '
+        f'`{" ".join(entry["statement"].split())[:200]}`'
+        for entry in reversed(entries)
+    )
+
+
+class Diagnostics(ft.UserControl):
+    def __init__(self, parent, page: ft.Page):
+        from .app_layout import UserInterface
+
+        super().__init__()
+        self.parent: UserInterface = parent
+        self.page = page
+        self.ui()
+        self.page.update()
+
+    def ui(self):
+        self.title = ft.Row(
+            controls=[
+                ft.Text(
+                    value='Diagnostics',
+                    font_family='SF thin',
+                    size=24,
+                    weight=ft.FontWeight.BOLD,
+                    text_align='center',
+                    expand=True,
+                ),
+            ]
+        )
+        self.refresh_button = ft.ElevatedButton(
+            'Refresh', icon=ft.icons.REFRESH, on_click=self.refresh
+        )
+        self.dump_button = ft.ElevatedButton(
+            'Save as JSON', icon=ft.icons.SAVE, on_click=self.dump
+        )
+        self.reset_button = ft.OutlinedButton(
+            'Reset', icon=ft.icons.DELETE_SWEEP, on_click=self.reset
+        )
+        self.content = ft.Markdown(
+            selectable=True,
+            extension_set=ft.MarkdownExtensionSet.GITHUB_WEB,
+        )
+        self.diagnostics_card = ft.Card(
+            expand=True,
+            content=ft.Container(
+                margin=ft.margin.all(15),
+                alignment=ft.alignment.top_center,
+                content=ft.Column(
+                    alignment=ft.MainAxisAlignment.START,
+                    controls=[
+                        self.title,
+                        ft.Row(
+                            controls=[
+                                self.refresh_button,
+                                self.dump_button,
+                                self.reset_button,
+                            ],
+                            alignment='center',
+                        ),
+                        ft.Divider(),
+                        self.content,
+                    ],
+                ),
+            ),
+        )
+
+        self.diagnostics_page_content = ft.Column(
+            scroll='auto',
+            alignment=ft.MainAxisAlignment.START,
+            horizontal_alignment='stretch',
+            expand=True,
+            controls=[
+                ft.Container(
+                    margin=ft.margin.all(25),
+                    alignment=ft.alignment.top_center,
+                    content=ft.Column(
+                        alignment=ft.MainAxisAlignment.START,
+                        controls=[
+                            ft.Row(
+                                controls=[self.diagnostics_card],
+                                alignment='center',
+                            ),
+                        ],
+                    ),
+                )
+            ],
+        )
+        self.set_content()
+
+    def build(self):
+        return self.diagnostics_page_content
+
+    @property
+    def allowed(self) -> bool:
+        return can_see_diagnostics(self.page, self.parent.username)
+
+    def set_content(self):
+        for button in (
+            self.refresh_button,
+            self.dump_button,
+            self.reset_button,
+        ):
+            button.visible = self.allowed
+        if not self.allowed:
+            self.content.value = '_Diagnostics are for the admin only._'
+            return
+
+        stats = get_query_stats()
+        snapshot = stats.snapshot()
+        router = get_tenant_router()
+        databases = router.open_databases()
+        # summed, in `user` mode the tenants are the usernames.
+        caches = counters_total(
+            database.todo_cache.stats() for database in databases.values()
+        )
+        self.content.value = '\n\n'.join(
+            [
+                f'**{snapshot["queries"]} queries since {snapshot["since"]}**',
+                '### Queries per action',
+                actions_table(snapshot),
+                f'### Repeated queries (n+1 suspects, {stats.repeated}+ runs)',
+                queries_list(snapshot['repeated_queries'], 'count', 'x'),
+                f'### Slow queries (over {stats.slow_ms}ms)',
+                queries_list(snapshot['slow_queries'], 'ms', 'ms'),
+                '### Statements (by total time)',
+                statements_table(snapshot),
+                f'### Tenants ({router.mode} mode)',
+                counters_table('router', {'tenants': router.stats()}),
+                f'### Todo cache ({len(databases)} databases)',
+                counters_table('cache', {'todos': caches}),
+                '### Login throttling',
+                counters_table(
+                    'limiter', {'logins': get_login_limiter().metrics()}
+                ),
+            ]
+        )
+
+    def refresh(self, e):
+        self.set_content()
+        self.page.update()
+
+    def dump(self, e):
+        if not self.allowed:
+            return
+        path = get_query_stats().dump()
+        self.parent.open_snack_bar(f'Saved to {path}')
+
+    def reset(self, e):
+        if not self.allowed:
+            return
+        get_query_stats().reset()
+        self.refresh(e)
@@ -483,6 +483,8 @@ class Home(ft.UserControl):
         self.page.update()
 
     def start(self, e):
+        # built first, the add account button is made by the accounts page.
+        accounts_page = self.parent.accounts_page
         self.start_button.disabled = True
         self.parent.is_farmer_running = True
         self.page.floating_action_button.disabled = True
@@ -492,12 +494,10 @@ class Home(ft.UserControl):
         self.timer_switch.disabled = True
         self.start_icon.visible = False
         self.start_progress_ring.visible = True
-        self.parent.accounts_page.reset_logs_button.disabled = True
-        self.parent.accounts_page.finish_all_logs_button.disabled = True
+        accounts_page.reset_logs_button.disabled = True
+        accounts_page.finish_all_logs_button.disabled = True
         self.page.update()
-        self.farmer = Farmer(
-            self.page, self.parent, self, self.parent.accounts_page
-        )
+        self.farmer = Farmer(self.page, self.parent, self, accounts_page)
         self.stop_button.disabled = False
         self.update_overall_infos()
         self.start_icon.visible = True
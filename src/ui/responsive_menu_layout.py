@@ -1,3 +1,4 @@
+import threading
 from copy import deepcopy
 
 import flet
@@ -24,6 +25,9 @@ from flet import (
 # from flet import slugify
 from slugify import slugify
 
+# narrower than this, the menu shows icons only.
+MENU_BREAKPOINT = 1170
+
 
 class ResponsiveMenuLayout(Row):
     def __init__(
@@ -36,6 +40,7 @@ class ResponsiveMenuLayout(Row):
         minimize_to_icons=False,
         landscape_minimize_to_icons=False,
         portrait_minimize_to_icons=False,
+        on_page_change=None,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
@@ -47,6 +52,7 @@ class ResponsiveMenuLayout(Row):
         self._landscape_minimize_to_icons = landscape_minimize_to_icons
         self._portrait_minimize_to_icons = portrait_minimize_to_icons
         self._support_routes = support_routes
+        self.on_page_change = on_page_change
 
         self.expand = True
 
@@ -57,12 +63,27 @@ class ResponsiveMenuLayout(Row):
             f"/{item.pop('route', None) or slugify(item['label'])}"
             for item in self.navigation_items
         ]
+        # both sets of destinations are built once, switching is a swap.
+        self._destinations = {
+            icons_only: self.build_destinations(icons_only)
+            for icons_only in (False, True)
+        }
+        self._resize_state = None
         self.navigation_rail = self.build_navigation_rail()
         self.update_destinations()
         self._menu_extended = menu_extended
         self.navigation_rail.extended = menu_extended
 
-        page_contents = [page_content for _, page_content in pages]
+        # a page given as a factory is built the first time it is shown
+        # (or asked for, see `page_content`), until then it is a placeholder.
+        self._factories = {}
+        self._factories_lock = threading.RLock()
+        page_contents = []
+        for page_number, (_, page_content) in enumerate(pages):
+            if callable(page_content):
+                self._factories[page_number] = page_content
+                page_content = Container(visible=False)
+            page_contents.append(page_content)
 
         self.menu_panel = Row(
             controls=[self.navigation_rail, VerticalDivider(width=1)],
@@ -83,6 +104,39 @@ class ResponsiveMenuLayout(Row):
 
         self.page.on_resize = self.handle_resize
 
+    def page_content(self, page_number):
+        """The content of page `page_number`, built if it was not yet."""
+        with self._factories_lock:
+            factory = self._factories.pop(page_number, None)
+            if factory is not None:
+                try:
+                    content = factory()
+                except BaseException:
+                    self._factories[page_number] = factory
+                    raise
+                content.visible = (
+                    page_number == self.navigation_rail.selected_index
+                )
+                self.content_area.controls[page_number] = content
+            return self.content_area.controls[page_number]
+
+    def is_built(self, page_number) -> bool:
+        return page_number not in self._factories
+
+    def prefetch(self, delay=0):
+        """Build the pages not shown yet in the background, after `delay`."""
+
+        def build_pages():
+            for page_number in range(len(self.pages)):
+                if not self.is_built(page_number):
+                    self.page_content(page_number)
+            self.page.update()
+
+        timer = threading.Timer(delay, build_pages)
+        timer.daemon = True
+        timer.start()
+        return timer
+
     def select_page(self, page_number):
         self.navigation_rail.selected_index = page_number
         self._change_displayed_page()
@@ -127,7 +181,7 @@ class ResponsiveMenuLayout(Row):
 
         dimension_minimized = (
             self.landscape_minimize_to_icons
-            if self.is_landscape() or self.page.width < 1170
+            if self.is_landscape() or self.page.width < MENU_BREAKPOINT
             else self.portrait_minimize_to_icons
         )
         if not dimension_minimized or self._panel_visible:
@@ -142,8 +196,11 @@ class ResponsiveMenuLayout(Row):
         page_number = self.navigation_rail.selected_index
         if self._support_routes:
             self.page.route = self.routes[page_number]
+        self.page_content(page_number)
         for i, content_page in enumerate(self.content_area.controls):
             content_page.visible = page_number == i
+        if self.on_page_change is not None:
+            self.on_page_change(self.routes[page_number])
 
     def _route_change(self, route):
         try:
@@ -164,36 +221,44 @@ class ResponsiveMenuLayout(Row):
             on_change=self._navigation_change,
         )
 
-    def update_destinations(self, icons_only=False):
+    def build_destinations(self, icons_only=False):
         navigation_items = self.navigation_items
         if icons_only:
             navigation_items = deepcopy(navigation_items)
             for item in navigation_items:
                 item.pop('label')
 
-        self.navigation_rail.destinations = [
+        return [
             NavigationRailDestination(**nav_specs)
             for nav_specs in navigation_items
         ]
+
+    def update_destinations(self, icons_only=False):
+        self.navigation_rail.destinations = self._destinations[icons_only]
         self.navigation_rail.label_type = 'none' if icons_only else 'all'
 
-    def handle_resize(self, e):
-        need_page_update = False
-        if self.page.width < 1170:
+    def handle_resize(self, e=None):
+        """
+        Lay the menu out again when the page crossed a breakpoint (the menu
+        width or the orientation). returns whether it did.
+        """
+        state = (self.page.width < MENU_BREAKPOINT, self.is_portrait())
+        if state == self._resize_state:
+            return False
+        self._resize_state = state
+
+        if self.page.width < MENU_BREAKPOINT:
             self.menu_extended = False
             self.update_destinations(icons_only=True)
-            need_page_update = True
         else:
             self.menu_extended = True
             self.update_destinations()
-            need_page_update = True
         if self._was_portrait != self.is_portrait():
             self._was_portrait = self.is_portrait()
             self._panel_visible = self.is_landscape()
             self.set_navigation_content()
-            need_page_update = True
-        if need_page_update:
-            self.page.update()
+        self.page.update()
+        return True
 
     def toggle_navigation(self, event=None):
         self._panel_visible = not self._panel_visible
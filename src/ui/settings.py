@@ -1,6 +1,10 @@
 import flet as ft
 
 from src.core import MOBILE_USER_AGENT, PC_USER_AGENT
+from src.core.batching import batched
+
+# narrower than this, long labels are shortened.
+COMPACT_WIDTH = 1140
 
 
 class ThemeChanger(ft.UserControl):
@@ -361,6 +365,7 @@ class ThemeChanger(ft.UserControl):
             self.page.theme.color_scheme_seed = e.control.data
         self.page.update()
 
+    @batched
     def set_widget_color(self, e):
         self.widget_color_grid.data = e.control.data
         for k, v in self.colors.items():
@@ -657,7 +662,11 @@ class Settings(ft.UserControl):
             on_change=lambda e: self.switches_on_change(e, 'mobile_search'),
         )
         self.msn_shopping_game_switch = ft.Switch(
-            label='MSN shopping game',
+            label=(
+                'MSN'
+                if (self.page.width or COMPACT_WIDTH) < COMPACT_WIDTH
+                else 'MSN shopping game'
+            ),
             value=False,
             active_color=self.color_scheme,
             label_position=ft.LabelPosition.LEFT,
@@ -806,6 +815,7 @@ class Settings(ft.UserControl):
         control.error_text = 'This field is required'
         self.page.update()
 
+    @batched
     def save_user_agents(self, e):
         user_agents_fields = [
             self.pc_user_agent_field,
@@ -835,6 +845,7 @@ class Settings(ft.UserControl):
             control.error_text = None
         self.page.update()
 
+    @batched
     def reset_to_default_user_agents(self, e):
         user_agents_fields = [
             self.pc_user_agent_field,
@@ -852,6 +863,7 @@ class Settings(ft.UserControl):
         self.parent.open_snack_bar('User agents have been reset to default.')
         self.page.update()
 
+    @batched
     def switches_on_change(self, e: ft.ControlEvent, save_as: str):
         farmer_options = [
             self.daily_quests_switch,
@@ -1,6 +1,8 @@
 import flet as ft
 import requests
 
+from src.core.batching import batched, flush_updates
+
 
 class Telegram(ft.UserControl):
     def __init__(self, parent, page: ft.Page):
@@ -293,12 +295,14 @@ class Telegram(ft.UserControl):
         control.value = ''
         self.page.update()
 
+    @batched
     def paste_from_clipboard(self, e, control: ft.TextField):
         value = self.page.get_clipboard()
         control.value = value
         self.are_telegram_fields_filled()
         self.page.update()
 
+    @batched
     def save(self, e):
         if self.are_telegram_fields_filled():
             self.page.update()
@@ -329,6 +333,7 @@ class Telegram(ft.UserControl):
         self.send_to_telegram_switch.value = False
         self.page.update()
 
+    @batched
     def send_to_telegram_switch_on_change(self, e, control: ft.Switch):
         if self.are_telegram_fields_filled():
             self.save(e)
@@ -336,6 +341,7 @@ class Telegram(ft.UserControl):
                 'MRFarmer.send_to_telegram', control.value
             )
 
+    @batched
     def text_fields_on_change(self, e: ft.ControlEvent):
         telegram_fields = [self.token_field, self.chat_id_field]
         if self.telegram_proxy_switch.value:
@@ -353,6 +359,7 @@ class Telegram(ft.UserControl):
                     field.error_text = None
             self.page.update()
 
+    @batched
     def send_test_message(self, e):
         if not self.are_telegram_fields_filled():
             return None
@@ -364,6 +371,8 @@ class Telegram(ft.UserControl):
         self.send_icon.visible = False
         self.progress_ring.visible = True
         self.page.update()
+        # the spinner shows while the message is sent.
+        flush_updates(self.page)
         try:
             url = f'https://api.telegram.org/bot{self.token_field.value}/sendMessage'
             data = {
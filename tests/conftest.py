@@ -0,0 +1,74 @@
+"""
+Every database test runs once per backend: sqlite (always) and postgresql.
+
+postgresql is the server at `TEST_POSTGRES_URL` or, with pytest-postgresql
+installed, a throwaway one. without any of them those tests are skipped.
+"""
+# python
+import os
+from pathlib import Path
+from typing import Iterator
+
+# 3rd
+import pytest
+
+# local
+from src.core import migrations
+from src.core.model import Base, DataBase
+from src.core.security import PasswordHasher
+from src.utils import constants
+
+
+def postgresql_url(request: pytest.FixtureRequest) -> str:
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if url:
+        return url
+
+    try:
+        from pytest_postgresql.exceptions import ExecutableMissingException
+    except ImportError:
+        pytest.skip('set TEST_POSTGRES_URL or install pytest-postgresql')
+
+    try:
+        info = request.getfixturevalue('postgresql').info
+    except ExecutableMissingException as error:
+        pytest.skip(str(error))
+    return (
+        f'postgresql+psycopg://{info.user}:{info.password or ""}'
+        f'@{info.host}:{info.port}/{info.dbname}'
+    )
+
+
+@pytest.fixture(autouse=True)
+def session_secret(monkeypatch: pytest.MonkeyPatch) -> None:
+    # or every DataBase generates a `.session_secret` where we run.
+    monkeypatch.setattr(constants, 'SESSION_SECRET', 'test-secret')
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request: pytest.FixtureRequest, tmp_path: Path) -> str:
+    if request.param == 'sqlite':
+        return f'sqlite:///{tmp_path / "db.sqlite3"}'
+    return postgresql_url(request)
+
+
+@pytest.fixture
+def database(database_url: str) -> Iterator[DataBase]:
+    database = DataBase(
+        database_url,
+        profile=constants.DB_ENGINE_PROFILES['desktop'],
+        # cheap hashes, the tests are not about scrypt.
+        hasher=PasswordHasher(n=2**4, max_workers=1),
+        write_behind=False,
+        default_user=False,
+        # a lazy load inside `no_lazy_loads` fails the test.
+        strict_loading=True,
+    )
+    yield database
+
+    # a shared server keeps its tables, leave it as we found it.
+    database.Session.remove()
+    if database.engine.dialect.name != 'sqlite':
+        Base.metadata.drop_all(database.engine)
+        migrations.version_metadata.drop_all(database.engine)
+    database.close()
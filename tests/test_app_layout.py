@@ -0,0 +1,104 @@
+# python
+import threading
+import time
+from types import SimpleNamespace
+
+# 3rd
+import pytest
+
+# local
+from src.ui import app_layout
+from src.ui.app_layout import UserInterface
+from src.utils import constants
+
+
+class Storage(dict):
+    def get(self, key):
+        return dict.get(self, key)
+
+    def set(self, key, value):
+        self[key] = value
+
+    def contains_key(self, key):
+        return key in self
+
+    def remove(self, key):
+        self.pop(key, None)
+
+
+class Page:
+    def __init__(self):
+        self.client_storage = Storage()
+        self.session = Storage()
+        self.overlay = []
+        self.width = 1280
+        self.height = 820
+        self.route = '/'
+        self.web = False
+        self.floating_action_button = None
+        self.snack_bar = None
+        self.dialog = None
+        self.updates = 0
+
+    def update(self, *controls):
+        self.updates += 1
+
+    def window_center(self):
+        pass
+
+
+@pytest.fixture
+def user_interface(monkeypatch):
+    monkeypatch.setattr(constants, 'PREFETCH_PAGES', False)
+    monkeypatch.setattr(constants, 'RESIZE_DEBOUNCE', 0.05)
+    # no release check going out from the tests.
+    monkeypatch.setattr(UserInterface, 'check_for_update', lambda *args: None)
+    built = []
+    build_page = UserInterface.build_page
+    monkeypatch.setattr(
+        UserInterface,
+        'build_page',
+        lambda self, name: built.append(name) or build_page(self, name),
+    )
+    user_interface = UserInterface(Page())
+    user_interface.built = built
+    return user_interface
+
+
+def test_pages_are_built_on_first_access_only(user_interface):
+    # the first page is shown, the others wait.
+    assert user_interface.built == ['home']
+    assert user_interface.built_page('about') is None
+
+    about = user_interface.about_page
+    assert isinstance(about, app_layout.About)
+    assert user_interface.about_page is about
+    assert user_interface.built_page('about') is about
+    assert user_interface.built == ['home', 'about']
+
+
+def resize_threads():
+    return [t for t in threading.enumerate() if t.name == 'resize']
+
+
+def test_a_burst_of_resizes_is_laid_out_once(user_interface, monkeypatch):
+    handled = []
+    monkeypatch.setattr(
+        user_interface.menu_layout, 'handle_resize', handled.append
+    )
+    for width in range(600, 1000, 20):
+        user_interface.on_page_resize(SimpleNamespace(data=f'{width},700'))
+        # one thread waits for the whole burst.
+        assert len(resize_threads()) == 1
+    assert handled == []
+
+    deadline = time.monotonic() + 5
+    while resize_threads() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    [event] = handled
+    assert event.data == '980,700'
+
+    # the next burst gets a thread of its own.
+    user_interface.on_page_resize(SimpleNamespace(data='500,700'))
+    resize_threads()[0].join()
+    assert [event.data for event in handled] == ['980,700', '500,700']
@@ -0,0 +1,109 @@
+# python
+import asyncio
+
+# local
+from src.core.async_model import get_async_database
+from src.core.model import DataBase
+from src.core.security import PasswordHasher
+from src.core.write_behind import WriteBehindQueue
+from src.utils import constants
+
+
+def test_async_twin_shares_the_database(database):
+    user = database.register_user('alice', 'secret')
+    async_database = get_async_database(database)
+    assert get_async_database(database) is async_database
+
+    async def run():
+        try:
+            logged = await async_database.login_user('alice', 'secret')
+            await async_database.register_todo('buy milk', True, logged.id)
+            # the default user is the business of the sync database.
+            return await async_database.filter_users(
+                username=constants.DEFAULT_USERNAME
+            )
+        finally:
+            await async_database.close()
+
+    assert asyncio.run(run()) == []
+    [todo] = database.filter_todos(id_user=user.id)
+    assert todo.description == 'buy milk'
+    assert database.todo_counters(user.id) == (1, 1)
+
+
+def test_async_delete_user_revokes_its_sessions(database):
+    user = database.register_user('alice', 'secret')
+    token = database.tokens.issue(user)
+    async_database = get_async_database(database)
+
+    async def run():
+        try:
+            await async_database.delete_user(user)
+        finally:
+            await async_database.close()
+
+    asyncio.run(run())
+    assert database.tokens.resolve(token) is None
+    assert database.filter_users(username='alice') == []
+
+
+def test_async_writes_drop_the_cached_todos(database):
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+    assert [t.completed for t in database.filter_todos(id_user=user.id)] == [
+        False
+    ]
+    async_database = get_async_database(database)
+    assert async_database.todo_cache is database.todo_cache
+
+    async def run():
+        try:
+            return await async_database.complete_all_todos(user.id)
+        finally:
+            await async_database.close()
+
+    assert asyncio.run(run()) == 1
+    assert [t.completed for t in database.filter_todos(id_user=user.id)] == [
+        True
+    ]
+
+
+def test_queued_writes_land_before_async_ones(database):
+    database.write_behind = WriteBehindQueue(database, interval=3600)
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+    assert len(database.write_behind) == 1
+    async_database = get_async_database(database)
+
+    async def run():
+        try:
+            return await async_database.complete_all_todos(user.id)
+        finally:
+            await async_database.close()
+
+    # the queued insert is written first, then completed.
+    assert asyncio.run(run()) == 1
+    assert len(database.write_behind) == 0
+    [todo] = database.filter_todos(id_user=user.id)
+    assert todo.completed
+    assert database.todo_counters(user.id) == (1, 1)
+    database.write_behind.close()
+
+
+def test_async_twin_uses_the_profile_of_its_database(tmp_path):
+    profile = dict(constants.DB_ENGINE_PROFILES['cluster'], pool_size=3)
+    database = DataBase(
+        tmp_path / 'tenant.sqlite3',
+        profile=profile,
+        hasher=PasswordHasher(n=2**4, max_workers=1),
+        write_behind=False,
+        default_user=False,
+        snapshots=False,
+    )
+    try:
+        pool = get_async_database(database).engine.pool
+        assert pool.size() == 3
+        assert pool._recycle == profile['pool_recycle']
+        assert pool._pre_ping
+    finally:
+        database.close()
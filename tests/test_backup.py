@@ -0,0 +1,45 @@
+# python
+import sqlite3
+
+# 3rd
+import pytest
+
+# local
+from src.core.backup import SnapshotScheduler
+
+
+def test_backup(database, tmp_path):
+    if database.engine.dialect.name != 'sqlite':
+        with pytest.raises(ValueError):
+            database.backup(tmp_path / 'copy.sqlite3')
+        return
+
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+
+    dest = database.backup(tmp_path / 'backups' / 'copy.sqlite3')
+
+    assert [path.name for path in dest.parent.iterdir()] == ['copy.sqlite3']
+    with sqlite3.connect(dest) as connection:
+        assert connection.execute('PRAGMA integrity_check').fetchone() == (
+            'ok',
+        )
+        assert connection.execute('SELECT count(*) FROM todo').fetchone() == (
+            1,
+        )
+
+
+def test_snapshots_are_pruned(database, tmp_path):
+    if database.engine.dialect.name != 'sqlite':
+        pytest.skip('snapshots are sqlite backups')
+
+    # a long interval, we take the snapshots ourselves.
+    scheduler = SnapshotScheduler(
+        database, directory=tmp_path, interval=3600, keep=2
+    )
+    try:
+        paths = [scheduler.snapshot() for _ in range(3)]
+    finally:
+        scheduler.close()
+
+    assert scheduler.existing() == paths[1:]
@@ -0,0 +1,84 @@
+# python
+import asyncio
+import threading
+
+# local
+from src.core.batching import (
+    batched,
+    batched_updates,
+    flush_updates,
+    get_update_batcher,
+)
+
+
+class Page:
+    def __init__(self):
+        self.sent = []
+
+    def update(self, *controls):
+        self.sent.append(controls)
+
+
+class View:
+    def __init__(self, page):
+        self.page = page
+
+    def show_error(self):
+        self.page.update()
+
+    @batched
+    def click(self):
+        self.page.update('field')
+        self.show_error()
+        self.page.update()
+
+    @batched
+    async def click_async(self):
+        self.page.update('field')
+        await asyncio.sleep(0)
+        self.page.update('field')
+
+
+def test_one_update_per_event():
+    page = Page()
+    batcher = get_update_batcher(page)
+    view = View(page)
+
+    view.click()
+    assert page.sent == [()]
+    assert batcher.stats() == {'requested': 3, 'pushed': 1, 'batches': 1}
+
+    # outside of a batch nothing changes.
+    view.show_error()
+    assert batcher.pushed == 2
+
+
+def test_only_the_updated_controls():
+    page = Page()
+    asyncio.run(View(page).click_async())
+    assert page.sent == [('field',)]
+
+
+def test_nested_batches_and_flush():
+    page = Page()
+    batcher = get_update_batcher(page)
+    with batched_updates(page):
+        page.update('spinner')
+        flush_updates(page)
+        assert page.sent == [('spinner',)]
+        with batched_updates(page):
+            page.update('a')
+        page.update('b')
+        assert len(page.sent) == 1
+    assert page.sent == [('spinner',), ('a', 'b')]
+    assert batcher.batches == 1
+
+
+def test_batches_are_per_thread():
+    page = Page()
+    with batched_updates(page):
+        thread = threading.Thread(target=page.update)
+        thread.start()
+        thread.join()
+        # the farmer thread, say, isn't held by an event handler.
+        assert page.sent == [()]
@@ -0,0 +1,31 @@
+# local
+from benchmarks.model import Case, cases, measure, regressions
+
+
+def test_regressions():
+    baseline = {'1k': {'fast': {'min_ms': 0.1}, 'slow': {'min_ms': 100}}}
+    results = {
+        '1k': {
+            # under the absolute slack, noise.
+            'fast': {'min_ms': 0.9},
+            'slow': {'min_ms': 130},
+            'new': {'min_ms': 1},
+        },
+        '100k': {'slow': {'min_ms': 1000}},
+    }
+
+    [failure] = regressions(results, baseline, threshold=0.25)
+    assert failure.startswith('1k slow: 130ms')
+    assert regressions(results, baseline, threshold=0.5) == []
+
+
+def test_cases_run(database):
+    user = database.register_user('user-1', 'secret')
+    database.bulk_register_todos(
+        {'description': f'todo {i}', 'completed': False, 'id_user': user.id}
+        for i in range(10)
+    )
+
+    for case in cases(database):
+        result = measure(Case(case.name, case.run, case.setup, repeat=1))
+        assert result['min_ms'] <= result['median_ms'] <= result['p95_ms']
@@ -0,0 +1,20 @@
+# python
+from types import SimpleNamespace
+
+# local
+from src.ui.diagnostics import can_see_diagnostics, counters_total
+from src.utils import constants
+
+
+def test_only_the_admin_sees_diagnostics_on_the_web():
+    desktop, web = SimpleNamespace(web=False), SimpleNamespace(web=True)
+    assert can_see_diagnostics(desktop, 'alice')
+    assert can_see_diagnostics(web, constants.DEFAULT_USERNAME)
+    assert not can_see_diagnostics(web, 'alice')
+    assert not can_see_diagnostics(web, None)
+
+
+def test_cache_counters_are_summed():
+    assert counters_total(
+        [{'hits': 1, 'misses': 2}, {'hits': 3, 'misses': 0}]
+    ) == {'hits': 4, 'misses': 2}
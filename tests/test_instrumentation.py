@@ -0,0 +1,40 @@
+# local
+from src.core.instrumentation import QueryStats, action, get_query_stats
+from src.core.model import User
+
+
+def test_lazy_loading_shows_up_as_repeated_queries(database):
+    stats = get_query_stats()
+    stats.reset()
+    for i in range(12):
+        user = database.register_user(f'user {i}', 'secret')
+        database.register_todo('buy milk', False, user.id)
+
+    @action('lazy')
+    def count_todos():
+        with database.session_scope() as session:
+            return sum(len(user.todos) for user in session.query(User))
+
+    assert count_todos() == 12
+
+    snapshot = stats.snapshot()
+    # one query for the users, one more per user for its todos.
+    assert snapshot['actions']['lazy'] == {
+        'runs': 1,
+        'queries': 13,
+        'queries_per_run': 13.0,
+        'max_queries': 13,
+    }
+    [repeated] = snapshot['repeated_queries']
+    assert repeated['action'] == 'lazy' and repeated['count'] == 12
+
+
+def test_slow_queries():
+    stats = QueryStats(slow_ms=50, slow_log_size=2)
+    for ms in (10, 60, 70, 80):
+        stats.record('SELECT 1', ms)
+
+    snapshot = stats.snapshot()
+    assert [entry['ms'] for entry in snapshot['slow_queries']] == [70, 80]
+    assert snapshot['statements'][0]['count'] == 4
+    assert snapshot['statements'][0]['max_ms'] == 80
@@ -0,0 +1,248 @@
+# 3rd
+import pytest
+from sqlalchemy import delete, func, select, text
+
+# local
+from src.core import migrations
+from src.core.model import (
+    AlreadyRegistered,
+    AuthSession,
+    Base,
+    LazyLoadError,
+    NotRegistered,
+    Todo,
+    User,
+    no_lazy_loads,
+)
+from src.core.tokens import load_secret
+from src.utils import constants
+
+
+def test_schema_is_up_to_date(database):
+    with database.engine.connect() as connection:
+        assert migrations.current_version(connection) == len(
+            migrations.MIGRATIONS
+        )
+
+
+def test_register_and_login(database):
+    user = database.register_user('alice', 'secret')
+
+    assert database.login_user('alice', 'secret').id == user.id
+    with pytest.raises(NotRegistered):
+        database.login_user('alice', 'wrong')
+    with pytest.raises(AlreadyRegistered):
+        database.register_user('alice', 'other')
+
+
+def test_unknown_usernames_cost_a_verify(database, monkeypatch):
+    database.register_user('alice', 'secret')
+    verified = []
+    verify = database.hasher.verify
+    monkeypatch.setattr(
+        database.hasher,
+        'verify',
+        lambda password, encoded: verified.append(encoded)
+        or verify(password, encoded),
+    )
+
+    for username in ('alice', 'nobody'):
+        with pytest.raises(NotRegistered):
+            database.login_user(username, 'wrong')
+    assert len(verified) == 2
+    assert all(database.hasher.is_hashed(encoded) for encoded in verified)
+
+
+def test_plaintext_passwords_are_upgraded(database):
+    # a row from before hashing.
+    database.insert_user(User(username='alice', password='secret'))
+    [user] = database.filter_users(username='alice')
+    assert not database.hasher.is_hashed(user.password)
+
+    database.login_user('alice', 'secret')
+    [user] = database.filter_users(username='alice')
+    assert database.hasher.is_hashed(user.password)
+    assert not database.hasher.needs_rehash(user.password)
+    assert database.login_user('alice', 'secret').id == user.id
+    with pytest.raises(NotRegistered):
+        database.login_user('alice', 'wrong')
+
+
+def test_session_tokens(database):
+    user = database.register_user('alice', 'secret')
+    token = database.tokens.issue(user)
+
+    assert database.tokens.resolve(token).id == user.id
+    database.tokens.revoke(token)
+    assert database.tokens.resolve(token) is None
+
+
+def test_session_secret_is_generated_once(tmp_path, monkeypatch):
+    path = tmp_path / 'data' / '.session_secret'
+    monkeypatch.setattr(constants, 'SESSION_SECRET', None)
+    monkeypatch.setattr(constants, 'SESSION_SECRET_FILE', path)
+
+    secret = load_secret()
+    assert load_secret() == secret == path.read_text().encode()
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_deleting_an_user_revokes_its_sessions(database):
+    user = database.register_user('alice', 'secret')
+    token = database.tokens.issue(user)
+    assert database.tokens.resolve(token).id == user.id
+
+    database.delete_user(user)
+    assert database.tokens.resolve(token) is None
+    with database.session_scope() as session:
+        assert session.scalar(select(func.count(AuthSession.id))) == 0
+
+
+def test_todo_counters_follow_every_write(database):
+    alice = database.register_user('alice', 'secret')
+    bob = database.register_user('bob', 'secret')
+
+    todo = database.register_todo('buy milk', False, alice.id)
+    database.register_todo('walk the dog', True, alice.id)
+    database.bulk_register_todos(
+        {'description': f'bob {i}', 'completed': False, 'id_user': bob.id}
+        for i in range(10)
+    )
+    todo.completed = True
+    database.update_todo(todo)
+    assert database.todo_counters(alice.id) == (2, 2)
+
+    ids = [todo.id for todo in database.filter_todos(id_user=bob.id)]
+    assert database.mark_todos_completed(ids[:4]) == 4
+    assert database.complete_all_todos(bob.id) == 6
+    assert database.delete_completed_todos(bob.id) == 10
+    database.delete_todo(todo)
+
+    assert database.todo_counters(alice.id) == (1, 1)
+    assert database.todo_counters(bob.id) == (0, 0)
+    database.rebuild_todo_counters()
+    assert database.todo_counters(alice.id) == (1, 1)
+
+
+def test_page_and_iter_todos(database):
+    user = database.register_user('alice', 'secret')
+    database.bulk_register_todos(
+        {'description': f'todo {i}', 'completed': False, 'id_user': user.id}
+        for i in range(25)
+    )
+
+    first = database.page_todos(user.id, limit=10)
+    second = database.page_todos(user.id, after_id=first[-1].id, limit=10)
+    assert len(first) == len(second) == 10
+    assert first[-1].id < second[0].id
+
+    streamed = list(database.iter_todos(user.id, batch_size=7))
+    assert [todo.id for todo in streamed] == sorted(
+        todo.id for todo in database.filter_todos(id_user=user.id)
+    )
+
+
+def test_writes_while_iterating_are_kept(database):
+    user = database.register_user('alice', 'secret')
+    for i in range(3):
+        database.register_todo(f'todo {i}', False, user.id)
+
+    todos = database.iter_todos(user.id, batch_size=2)
+    todo = next(todos)
+    todo.completed = True
+    database.update_todo(todo)
+    # the caller stops early, its write isn't rolled back with the stream.
+    todos.close()
+
+    assert database.select_todo_by_id(todo.id).completed
+    assert database.todo_counters(user.id) == (3, 1)
+
+
+def test_search_todos(database):
+    alice = database.register_user('alice', 'secret')
+    bob = database.register_user('bob', 'secret')
+    database.register_todo('Buy milk and bread', False, alice.id)
+    database.register_todo('Walk the dog', False, alice.id)
+    database.register_todo('Buy milk', False, bob.id)
+
+    found = database.search_todos(alice.id, 'mil bre')
+    assert [todo.description for todo in found] == ['Buy milk and bread']
+    assert database.search_todos(alice.id, '"*') == []
+    assert all(isinstance(todo, Todo) for todo in found)
+
+
+def test_search_index_is_rebuilt_with_the_owner(database):
+    if database.engine.dialect.name != 'sqlite':
+        pytest.skip('the fts5 index is sqlite only')
+
+    alice = database.register_user('alice', 'secret')
+    database.register_todo('Buy milk', False, alice.id)
+    # back to a version 6 database, without the search index.
+    with database.engine.begin() as connection:
+        for statement in migrations.DROP_TODO_SEARCH_DDL:
+            connection.execute(text(statement))
+        connection.execute(
+            delete(migrations.schema_version).where(
+                migrations.schema_version.c.version == 7
+            )
+        )
+        assert migrations.upgrade(connection, Base.metadata) == 7
+
+    [todo] = database.search_todos(alice.id, 'milk')
+    assert todo.description == 'Buy milk'
+    assert database.search_todos(alice.id + 1, 'milk') == []
+
+
+def test_eager_reads_render_lists_without_lazy_loads(database):
+    for name in ('alice', 'bob'):
+        user = database.register_user(name, 'secret')
+        database.register_todo(f'{name} todo', False, user.id)
+
+    with no_lazy_loads():
+        todos = database.select_todos(with_user=True)
+        owners = [todo.user.username for todo in todos]
+        counts = {
+            user.username: len(user.todos)
+            for user in database.select_users(with_todos=True)
+        }
+        [alice] = database.filter_users(username='alice', with_todos=True)
+        [todo] = database.filter_todos(id_user=alice.id, with_user=True)
+
+    assert sorted(owners) == ['alice', 'bob']
+    assert counts == {'alice': 1, 'bob': 1}
+    assert todo.user.username == 'alice'
+
+
+def test_lazy_loads_raise_while_rendering_lists(database):
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+
+    with no_lazy_loads(), database.session_scope() as session:
+        with pytest.raises(LazyLoadError):
+            [len(user.todos) for user in session.query(User)]
+
+    # outside of a list rendering it's allowed.
+    with database.session_scope() as session:
+        assert [len(user.todos) for user in session.query(User)] == [1]
+
+
+def test_cached_todos_are_not_shared(database):
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+
+    [todo] = database.filter_todos(id_user=user.id)
+    todo.description = 'changed, not saved'
+    [again] = database.filter_todos(id_user=user.id)
+    assert again.description == 'buy milk'
+    again.completed = True
+    [cached] = database.filter_todos(id_user=user.id)
+    assert cached is not again and not cached.completed
+    assert database.todo_cache.stats()['hits'] == 2
+
+    # still saved like a todo just loaded.
+    cached.completed = True
+    database.update_todo(cached)
+    assert database.todo_counters(user.id) == (1, 1)
+    [saved] = database.filter_todos(id_user=user.id, completed=True)
+    assert saved.id == cached.id
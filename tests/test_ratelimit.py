@@ -0,0 +1,60 @@
+# python
+from types import SimpleNamespace
+
+# 3rd
+import pytest
+
+# local
+from src.core import ratelimit
+from src.core.ratelimit import LoginRateLimiter, RateLimited
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=120.0)
+    monkeypatch.setattr(
+        ratelimit, 'time', SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+def test_window_blocks_at_the_limit_and_resets(clock):
+    limiter = LoginRateLimiter(username_limit=3, client_limit=100, window=60)
+    for _ in range(3):
+        limiter.check('Alice', '10.0.0.1')
+    with pytest.raises(RateLimited) as raised:
+        limiter.check('alice', '10.0.0.1')
+    assert raised.value.retry_after == 60
+    # other usernames are not held back.
+    limiter.check('bob', '10.0.0.1')
+
+    # half of the previous window still counts, as 1.5 attempts.
+    clock.now = 210.0
+    limiter.check('alice', None)
+    limiter.check('alice', None)
+    with pytest.raises(RateLimited):
+        limiter.check('alice', None)
+
+    # a whole window later, nothing counts anymore.
+    clock.now = 300.0
+    limiter.check('alice', None)
+    assert limiter.metrics() == {
+        'allowed': 7,
+        'throttled_usernames': 2,
+        'throttled_clients': 0,
+        'tracked_usernames': 2,
+        'tracked_clients': 1,
+    }
+
+
+def test_success_clears_the_username(clock):
+    limiter = LoginRateLimiter(username_limit=2, client_limit=3, window=60)
+    limiter.check('alice', '10.0.0.1')
+    limiter.check('alice', '10.0.0.1')
+    limiter.succeeded('alice')
+    limiter.check('alice', '10.0.0.1')
+
+    # the client keeps its count.
+    with pytest.raises(RateLimited):
+        limiter.check('alice', '10.0.0.1')
+    assert limiter.metrics()['throttled_clients'] == 1
@@ -0,0 +1,132 @@
+# python
+import asyncio
+import threading
+from types import SimpleNamespace
+
+# 3rd
+import pytest
+
+# local
+from src.core import tenancy
+from src.core.async_model import get_async_database
+from src.core.tenancy import DEFAULT_TENANT, TenantRouter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        tenancy, 'time', SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+@pytest.fixture
+def default_database(monkeypatch):
+    # the shared database of DB_URL stays out of it.
+    default_database = object()
+    monkeypatch.setattr(
+        tenancy, 'get_database', lambda db_name: default_database
+    )
+    return default_database
+
+
+@pytest.fixture
+def router(tmp_path, clock, default_database):
+    router = TenantRouter(
+        mode='user', directory=tmp_path, max_open=2, idle_timeout=60
+    )
+    yield router
+    router.close()
+
+
+def test_one_file_per_user(router, tmp_path, default_database):
+    assert router.tenant_for('Alice Smith') == 'alice-smith'
+    assert router.tenant_for(None) == DEFAULT_TENANT
+    # a login never creates an empty file.
+    assert router.database('alice-smith') is None
+    assert not any(tmp_path.iterdir())
+
+    alice = router.database('alice-smith', create=True)
+    bob = router.database('bob', create=True)
+    assert alice is not bob
+    assert router.path_for('alice-smith') == tmp_path / 'alice-smith.sqlite3'
+    assert {path.name for path in tmp_path.glob('*.sqlite3')} == {
+        'alice-smith.sqlite3',
+        'bob.sqlite3',
+    }
+    assert router.database('alice-smith') is alice
+    assert router.open_databases()[DEFAULT_TENANT] is default_database
+
+    alice.register_user('alice smith', 'secret')
+    assert bob.filter_users(username='alice smith') == []
+
+
+def test_single_mode_shares_the_default_database(tmp_path, default_database):
+    router = TenantRouter(mode='single', directory=tmp_path)
+    assert router.tenant_for('alice') == DEFAULT_TENANT
+    assert router.database('alice') is default_database
+    assert not tmp_path.exists() or not any(tmp_path.iterdir())
+
+
+def test_least_recently_used_is_closed(router):
+    alice = router.database('alice', create=True)
+    router.database('bob', create=True)
+    # alice is used again, bob is now the oldest.
+    assert router.database('alice') is alice
+    router.database('carol', create=True)
+
+    assert set(router.open_databases()) == {DEFAULT_TENANT, 'alice', 'carol'}
+    assert router.stats() == {'open': 2, 'opened': 3, 'closed': 1}
+
+
+def test_idle_tenants_are_closed(router, clock):
+    router.database('alice', create=True)
+    clock.now += 30
+    router.database('bob', create=True)
+
+    clock.now += 45
+    # alice was idle 75s, bob only 45s.
+    router.database('bob')
+    assert set(router.open_databases()) == {DEFAULT_TENANT, 'bob'}
+    assert router.stats() == {'open': 1, 'opened': 2, 'closed': 1}
+
+
+def test_closed_tenant_is_reopened(router, clock):
+    alice = router.database('alice', create=True)
+    user = alice.register_user('alice', 'secret')
+
+    clock.now += 120
+    router.database('bob', create=True)
+    assert 'alice' not in router.open_databases()
+
+    reopened = router.database('alice')
+    assert reopened is not alice
+    assert reopened.login_user('alice', 'secret').id == user.id
+    assert router.stats() == {'open': 2, 'opened': 3, 'closed': 1}
+
+
+def connection_threads():
+    return [
+        thread
+        for thread in threading.enumerate()
+        if 'connection_worker' in thread.name
+    ]
+
+
+def test_evicted_tenant_closes_its_async_twin(router):
+    alice = router.database('alice', create=True)
+    alice.register_user('alice', 'secret')
+    twin = get_async_database(alice)
+    assert get_async_database(alice) is twin is alice.async_twin
+
+    async def run():
+        assert await twin.filter_users(username='alice')
+        # evicts alice, on the event loop as the async handler does.
+        router.database('bob', create=True)
+        router.database('carol', create=True)
+
+    asyncio.run(run())
+    assert alice.async_twin is None
+    # aiosqlite threads aren't daemons, one left would hang the exit.
+    assert connection_threads() == []
@@ -0,0 +1,97 @@
+# 3rd
+import pytest
+
+# local
+from src.core import transfer
+from src.core.model import DataBase
+from src.core.security import PasswordHasher
+from src.utils import constants
+
+
+def target_database(path, **kwargs):
+    return DataBase(
+        path,
+        hasher=PasswordHasher(n=2**4, max_workers=1),
+        write_behind=False,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize('format', transfer.FORMATS)
+def test_export_import_round_trip(database, tmp_path, format):
+    user = database.register_user('alice', 'secret')
+    database.bulk_register_todos(
+        {
+            'description': f'todo {i}, "quoted"',
+            'completed': i % 3 == 0,
+            'id_user': user.id,
+        }
+        for i in range(1200)
+    )
+
+    progress = []
+    counts = transfer.export_database(
+        database, tmp_path, format, lambda *args: progress.append(args)
+    )
+    assert counts == {'user': 1, 'todo': 1200}
+    assert progress[-1] == ('todo', 1200)
+
+    target = target_database(tmp_path / 'target.sqlite3', default_user=False)
+    try:
+        assert transfer.import_database(target, tmp_path) == counts
+        assert target.login_user('alice', 'secret').id == user.id
+        assert target.todo_counters(user.id) == (1200, 400)
+        assert list(target.export_rows('todo')) == list(
+            database.export_rows('todo')
+        )
+        # new rows don't collide with the imported ids.
+        assert target.register_todo('new', False, user.id).id == 1201
+    finally:
+        target.close()
+
+
+def test_writes_during_an_export_are_kept(database):
+    database.register_user('alice', 'secret')
+    rows = database.export_rows('user')
+    assert next(rows)['username'] == 'alice'
+    database.register_user('bob', 'secret')
+    rows.close()
+
+    assert [user.username for user in database.select_users()] == [
+        'alice',
+        'bob',
+    ]
+
+
+def test_import_next_to_the_default_user(database, tmp_path):
+    admin = database.register_user(constants.DEFAULT_USERNAME, 'exported')
+    alice = database.register_user('alice', 'secret')
+    database.register_todo('admin todo', False, admin.id)
+    database.register_todo('alice todo', True, alice.id)
+    transfer.export_database(database, tmp_path)
+
+    # a fresh app database, with its default user already.
+    target = target_database(tmp_path / 'target.sqlite3')
+    try:
+        [default] = target.filter_users(username=constants.DEFAULT_USERNAME)
+        target.register_todo('kept', False, default.id)
+        assert transfer.import_database(target, tmp_path) == {
+            'user': 2,
+            'todo': 2,
+        }
+
+        # the default user keeps its password, and gets the exported todos.
+        assert target.login_user(
+            constants.DEFAULT_USERNAME, constants.DEFAULT_PASSWORD
+        )
+        assert sorted(
+            todo.description
+            for todo in target.filter_todos(id_user=default.id)
+        ) == ['admin todo', 'kept']
+        imported = target.login_user('alice', 'secret')
+        assert imported.id != default.id
+        [todo] = target.filter_todos(id_user=imported.id)
+        assert todo.description == 'alice todo'
+        assert target.todo_counters(imported.id) == (1, 1)
+    finally:
+        target.close()
@@ -0,0 +1,238 @@
+# python
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 3rd
+import pytest
+
+# local
+from src.core.updater import (
+    DownloadFailed,
+    UpdateChecker,
+    UpdateCheckFailed,
+    download,
+    etag_path,
+    partial_path,
+    release_sha256,
+)
+
+RELEASE = {'tag_name': '1.5', 'name': 'v1.5', 'body': 'notes', 'id': 1}
+ETAG = '"release-1.5"'
+ARCHIVE = bytes(range(256)) * 1000
+ARCHIVE_SHA256 = hashlib.sha256(ARCHIVE).hexdigest()
+ARCHIVE_ETAG = f'"{ARCHIVE_SHA256[:16]}"'
+
+
+class ReleasesHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        time.sleep(server.delay)
+        if self.path.startswith('/archive'):
+            return self.send_archive()
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(RELEASE).encode()
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_archive(self):
+        archive = self.server.archive
+        etag = f'"{hashlib.sha256(archive).hexdigest()[:16]}"'
+        start = 0
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if (
+            range_header
+            and self.path == '/archive'
+            and if_range in (None, etag)
+        ):
+            start = int(range_header[len('bytes=') : -1])
+            if start >= len(archive):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(archive)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                'Content-Range',
+                f'bytes {start}-{len(archive) - 1}/{len(archive)}',
+            )
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(archive) - start))
+        self.end_headers()
+        self.wfile.write(archive[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReleasesHandler)
+    server.requests = []
+    server.delay = 0
+    server.archive = ARCHIVE
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def checker_for(server, tmp_path, **kwargs):
+    host, port = server.server_address
+    return UpdateChecker(
+        f'http://{host}:{port}/releases/latest',
+        tmp_path / 'update_check.json',
+        **kwargs,
+    )
+
+
+def test_cached_while_fresh(server, tmp_path):
+    checker = checker_for(server, tmp_path, ttl=60)
+    assert checker.latest_release() == {
+        'tag_name': '1.5',
+        'name': 'v1.5',
+        'body': 'notes',
+    }
+    # a new launch, same cache file.
+    assert checker_for(server, tmp_path, ttl=60).latest_release()['name'] == (
+        'v1.5'
+    )
+    assert len(server.requests) == 1
+
+
+def test_stale_cache_is_revalidated(server, tmp_path):
+    checker = checker_for(server, tmp_path, ttl=0)
+    checker.latest_release()
+    assert checker.latest_release()['tag_name'] == '1.5'
+    assert [r.get('If-None-Match') for r in server.requests] == [None, ETAG]
+
+
+def test_timeout(server, tmp_path):
+    server.delay = 1
+    checker = checker_for(server, tmp_path, timeout=0.1)
+    started = time.perf_counter()
+    with pytest.raises(UpdateCheckFailed):
+        checker.latest_release()
+    assert time.perf_counter() - started < 0.9
+
+
+def test_check_in_background(server, tmp_path):
+    server.delay = 0.2
+    results = []
+    checker = checker_for(server, tmp_path)
+    thread = checker.check_in_background(
+        lambda release, error: results.append((release, error))
+    )
+    # the caller isn't kept waiting for the answer.
+    assert results == []
+    thread.join()
+    [(release, error)] = results
+    assert release['tag_name'] == '1.5' and error is None
+
+
+def url_of(server, path):
+    host, port = server.server_address
+    return f'http://{host}:{port}{path}'
+
+
+def test_download(server, tmp_path):
+    dest = tmp_path / 'update.zip'
+    reports = []
+    etags = []
+
+    def progress(done, total):
+        reports.append((done, total))
+        if etag_path(dest).exists():
+            etags.append(etag_path(dest).read_text())
+
+    download(
+        url_of(server, '/archive'),
+        dest,
+        sha256=ARCHIVE_SHA256,
+        progress=progress,
+        chunk_size=1024,
+        every=60,
+    )
+    assert dest.read_bytes() == ARCHIVE
+    assert not partial_path(dest).exists() and not etag_path(dest).exists()
+    # throttled: the start and the end only.
+    assert reports == [(0, len(ARCHIVE)), (len(ARCHIVE), len(ARCHIVE))]
+    # kept while downloading, to resume against.
+    assert etags == [ARCHIVE_ETAG]
+
+
+@pytest.mark.parametrize('path', ['/archive', '/archive-no-range'])
+def test_download_resumes(server, tmp_path, path):
+    dest = tmp_path / 'update.zip'
+    partial_path(dest).write_bytes(ARCHIVE[:1000])
+    etag_path(dest).write_text(ARCHIVE_ETAG)
+    download(url_of(server, path), dest, sha256=ARCHIVE_SHA256)
+    assert dest.read_bytes() == ARCHIVE
+    assert server.requests[0]['Range'] == 'bytes=1000-'
+    assert server.requests[0]['If-Range'] == ARCHIVE_ETAG
+    assert not etag_path(dest).exists()
+
+
+@pytest.mark.parametrize('etag', [None, 'W/"weak"'])
+def test_download_without_etag_starts_over(server, tmp_path, etag):
+    dest = tmp_path / 'update.zip'
+    # the start of some other file, say.
+    partial_path(dest).write_bytes(bytes(1000))
+    if etag is not None:
+        etag_path(dest).write_text(etag)
+    download(url_of(server, '/archive'), dest)
+    assert dest.read_bytes() == ARCHIVE
+    assert 'Range' not in server.requests[0]
+
+
+def test_download_starts_over_when_the_file_changed(server, tmp_path):
+    dest = tmp_path / 'update.zip'
+    partial_path(dest).write_bytes(ARCHIVE[:1000])
+    etag_path(dest).write_text(ARCHIVE_ETAG)
+    server.archive = bytes(reversed(ARCHIVE))
+    download(
+        url_of(server, '/archive'),
+        dest,
+        sha256=hashlib.sha256(server.archive).hexdigest(),
+    )
+    # not the old part with the end of the new file.
+    assert dest.read_bytes() == server.archive
+    assert len(server.requests) == 1
+
+
+def test_download_already_complete(server, tmp_path):
+    dest = tmp_path / 'update.zip'
+    partial_path(dest).write_bytes(ARCHIVE)
+    etag_path(dest).write_text(ARCHIVE_ETAG)
+    download(url_of(server, '/archive'), dest, sha256=ARCHIVE_SHA256)
+    assert dest.read_bytes() == ARCHIVE
+    # nothing left to get.
+    assert server.requests[0]['Range'] == f'bytes={len(ARCHIVE)}-'
+
+
+def test_download_checksum_mismatch(server, tmp_path):
+    dest = tmp_path / 'update.zip'
+    with pytest.raises(DownloadFailed):
+        download(url_of(server, '/archive'), dest, sha256='0' * 64)
+    assert not dest.exists() and not partial_path(dest).exists()
+    assert not etag_path(dest).exists()
+
+
+def test_release_sha256():
+    assert release_sha256({'body': f'SHA256: {ARCHIVE_SHA256.upper()}'}) == (
+        ARCHIVE_SHA256
+    )
+    assert release_sha256({'body': 'notes'}) is None
@@ -0,0 +1,87 @@
+# 3rd
+import pytest
+
+# local
+from src.core.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def queue(database):
+    # flushed by hand only, the interval never runs out in a test.
+    database.write_behind = WriteBehindQueue(database, interval=3600)
+    yield database.write_behind
+    database.write_behind.close()
+
+
+def test_group_commit(database, queue):
+    user = database.register_user('alice', 'secret')
+    for i in range(10):
+        database.register_todo(f'todo {i}', False, user.id)
+    assert len(queue) == 10
+
+    assert queue.flush() == 10
+    assert queue.stats() == {
+        'pending': 0,
+        'flushes': 1,
+        'flushed_ops': 10,
+        'failed_ops': 0,
+    }
+    assert len(database.filter_todos(id_user=user.id)) == 10
+
+
+def test_writes_of_the_same_key_are_merged(database, queue):
+    user = database.register_user('alice', 'secret')
+    todo = database.register_todo('buy milk', False, user.id)
+    database.flush()
+
+    for completed in (True, False, True):
+        todo.completed = completed
+        database.update_todo(todo)
+    assert len(queue) == 1
+
+    database.flush()
+    [stored] = database.filter_todos(id_user=user.id)
+    assert stored.completed
+    assert database.todo_counters(user.id) == (1, 1)
+
+
+def test_insert_then_delete_before_a_flush(database, queue):
+    user = database.register_user('alice', 'secret')
+    first = database.register_todo('buy milk', False, user.id)
+    second = database.register_todo('walk the dog', False, user.id)
+    # neither has an id yet, their deletes mustn't share a key.
+    database.delete_todo(first)
+    database.delete_todo(second)
+    assert len(queue) == 4
+
+    database.flush()
+    assert database.filter_todos(id_user=user.id) == []
+    assert database.todo_counters(user.id) == (0, 0)
+
+
+def test_close_flushes(database, queue):
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+
+    queue.close()
+    assert queue.stats()['pending'] == 0
+    assert len(database.filter_todos(id_user=user.id)) == 1
+
+    # once closed, writes go straight to the database.
+    database.register_todo('walk the dog', False, user.id)
+    assert len(queue) == 0
+    assert len(database.filter_todos(id_user=user.id)) == 2
+
+
+def test_users_with_todos_see_the_queued_ones(database, queue):
+    user = database.register_user('alice', 'secret')
+    database.register_todo('buy milk', False, user.id)
+    assert len(queue) == 1
+
+    for users in (
+        database.select_users(with_todos=True),
+        [database.select_user_by_id(user.id, with_todos=True)],
+        database.filter_users(with_todos=True, username='alice'),
+    ):
+        [alice] = users
+        assert [todo.description for todo in alice.todos] == ['buy milk']